@@ -6,6 +6,12 @@ import subprocess
 import time
 import re
 import json
+import copy
+import heapq
+import queue
+import bisect
+import hashlib
+import sqlite3
 import tkinter as tk
 from tkinter import font as tkfont
 import customtkinter as ctk
@@ -15,18 +21,32 @@ import atexit
 import signal
 from datetime import datetime
 from openai import OpenAI
-from typing import Optional, Dict, List, Callable
+from typing import Optional, Dict, List, Callable, NamedTuple, Tuple
+from collections import OrderedDict
 from tkinter import filedialog, messagebox
 import html
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_FILE = os.path.join(BASE_DIR, "settings.json")
 SESSIONS_FILE = os.path.join(BASE_DIR, "sessions.json")
+SESSIONS_JOURNAL_FILE = os.path.join(BASE_DIR, "sessions.journal")
+SESSIONS_DB_FILE = os.path.join(BASE_DIR, "sessions.db")
+STREAM_CHECKPOINT_FILE = os.path.join(BASE_DIR, "stream.checkpoint")
 
 DEFAULT_OLLAMA_PATH = r"C:\Users\Peter-Susan\Desktop\ollama-ipex-llm-2.3.0b20250630-win\start-ollama.bat"
 OLLAMA_API_BASE = "http://localhost:11434"
 OLLAMA_CHAT_URL = f"{OLLAMA_API_BASE}/v1"
 API_KEY = "ollama"
+UI_FRAME_MS = 16  # Frame budget for streaming UI work
+DEFAULT_KEEP_ALIVE = "30m"  # How long the server keeps a model loaded after a reply
+# Native /api/chat options editable in the settings panel: (key, label, type)
+OLLAMA_OPTIONS = (
+    ("num_predict", "Max tokens", int), ("top_k", "Top K", int), ("top_p", "Top P", float),
+    ("seed", "Seed", int), ("num_thread", "CPU threads", int), ("num_batch", "Batch size", int),
+    ("num_gpu", "GPU layers", int),
+)
+# Settings each chat remembers along with its model
+SESSION_SAMPLING_KEYS = ("temperature", "context_length", "num_predict", "top_k", "top_p", "seed")
 
 
 def copy_html_to_clipboard(html_content: str, plain_text: str) -> bool:
@@ -130,215 +150,27 @@ def copy_html_to_clipboard(html_content: str, plain_text: str) -> bool:
         print(f"Clipboard error: {e}")
         return False
 
-def markdown_to_html(text: str) -> str:
-    # Clean thinking tags
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-    text = re.sub(r'<think>.*$', '', text, flags=re.DOTALL)
-    text = re.sub(r'</think>', '', text)
-    text = re.sub(r'<think>', '', text)
-    
-    lines = text.split('\n')
-    html_parts = []
-    i = 0
-    in_list = False
-    list_type = None
-    
-    while i < len(lines):
-        line = lines[i].rstrip()
-        
-        # Code Blocks
-        if line.strip().startswith('```'):
-            if in_list:
-                html_parts.append(f"</{list_type}>")
-                in_list = False
-            i += 1
-            code_lines = []
-            while i < len(lines) and not lines[i].strip().startswith('```'):
-                code_lines.append(html.escape(lines[i]))
-                i += 1
-            code_content = '<br>'.join(code_lines)
-            # Word friendly code block style
-            html_parts.append(
-                f'<div style="background-color:#f0f0f0; padding:10px; border:1px solid #ccc; '
-                f'font-family:Consolas,monospace; font-size:10pt; white-space:pre-wrap;">'
-                f'{code_content}</div>'
-            )
-            i += 1
-            continue
-            
-        # Tables
-        if line.strip().startswith('|') and line.strip().endswith('|'):
-            if in_list:
-                html_parts.append(f"</{list_type}>")
-                in_list = False
-            table_lines = []
-            while i < len(lines) and lines[i].strip().startswith('|'):
-                table_lines.append(lines[i])
-                i += 1
-            html_parts.append(parse_table_to_html(table_lines))
-            continue
-            
-        # Horizontal Rules
-        if line.strip() in ['---', '***', '___']:
-            if in_list:
-                html_parts.append(f"</{list_type}>")
-                in_list = False
-            html_parts.append('<hr>')
-            i += 1
-            continue
-            
-        # Headers
-        header_match = re.match(r'^(#{1,6})\s+(.+)$', line)
-        if header_match:
-            if in_list:
-                html_parts.append(f"</{list_type}>")
-                in_list = False
-            level = len(header_match.group(1))
-            content = process_inline_formatting_html(header_match.group(2))
-            html_parts.append(f'<h{level}>{content}</h{level}>')
-            i += 1
-            continue
-            
-        # Unordered Lists
-        bullet_match = re.match(r'^(\s*)([-*+])\s+(.+)$', line)
-        if bullet_match:
-            content = process_inline_formatting_html(bullet_match.group(3))
-            if not in_list or list_type != "ul":
-                if in_list:
-                    html_parts.append(f"</{list_type}>")
-                html_parts.append("<ul>")
-                in_list = True
-                list_type = "ul"
-            html_parts.append(f"<li>{content}</li>")
-            i += 1
-            continue
-            
-        # Ordered Lists
-        num_match = re.match(r'^(\s*)(\d+\.)\s+(.+)$', line)
-        if num_match:
-            content = process_inline_formatting_html(num_match.group(3))
-            if not in_list or list_type != "ol":
-                if in_list:
-                    html_parts.append(f"</{list_type}>")
-                html_parts.append("<ol>")
-                in_list = True
-                list_type = "ol"
-            html_parts.append(f"<li>{content}</li>")
-            i += 1
-            continue
-            
-        # Empty Lines
-        if not line.strip():
-            if in_list:
-                html_parts.append(f"</{list_type}>")
-                in_list = False
-            i += 1
-            continue
-            
-        # Close list if regular text
-        if in_list:
-            html_parts.append(f"</{list_type}>")
-            in_list = False
-            
-        content = process_inline_formatting_html(line)
-        html_parts.append(f"<p>{content}</p>")
-        i += 1
-        
-    if in_list:
-        html_parts.append(f"</{list_type}>")
-        
-    return ''.join(html_parts)
 
-def parse_table_to_html(lines: List[str]) -> str:
-    rows = []
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith('|') and stripped.endswith('|'):
-            cells = [c.strip() for c in stripped.split('|')]
-            cells = cells[1:-1]
-            if cells and all(re.match(r'^[\-:\s]+$', cell) and '-' in cell for cell in cells):
-                continue
-            rows.append(cells)
-    if not rows:
-        return ""
-        
-    # Inline CSS is critical for Word/PowerPoint
-    html_parts = ['<table style="border-collapse: collapse; width: 100%; border: 1px solid black;">']
-    for idx, row in enumerate(rows):
-        html_parts.append("<tr>")
-        is_header = idx == 0
-        tag = "th" if is_header else "td"
-        bg_style = "background-color: #d3d3d3;" if is_header else ""
-        font_style = "font-weight: bold;" if is_header else ""
-        
-        for cell in row:
-            content = process_inline_formatting_html(cell)
-            html_parts.append(
-                f'<{tag} style="border: 1px solid black; padding: 5px; {bg_style} {font_style}">'
-                f'{content}</{tag}>'
-            )
-        html_parts.append("</tr>")
-    html_parts.append("</table>")
-    return ''.join(html_parts)
+INLINE_HTML_TAGS = {
+    "bold": ("<strong>", "</strong>"),
+    "italic": ("<em>", "</em>"),
+    "bold_italic": ("<strong><em>", "</em></strong>"),
+    "underline": ("<u>", "</u>"),
+    "strikethrough": ("<del>", "</del>"),
+    "inline_code": ("<code>", "</code>"),
+}
 
-def parse_table_to_html(lines: List[str]) -> str:
-    rows = []
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith('|') and stripped.endswith('|'):
-            cells = [c.strip() for c in stripped.split('|')]
-            cells = cells[1:-1]
-            if cells and all(re.match(r'^[\-:\s]+$', cell) and '-' in cell for cell in cells):
-                continue
-            rows.append(cells)
-    if not rows:
-        return ""
-        
-    html_parts = ['<table style="border-collapse: collapse; width: 100%; border: 1px solid black;">']
-    for idx, row in enumerate(rows):
-        html_parts.append("<tr>")
-        is_header = idx == 0
-        tag = "th" if is_header else "td"
-        bg_style = "background-color: #f2f2f2;" if is_header else ""
-        font_style = "font-weight: bold;" if is_header else ""
-        
-        for cell in row:
-            content = process_inline_formatting_html(cell)
-            html_parts.append(
-                f'<{tag} style="border: 1px solid black; padding: 8px; {bg_style} {font_style}">'
-                f'{content}</{tag}>'
-            )
-        html_parts.append("</tr>")
-    html_parts.append("</table>")
-    return ''.join(html_parts)
 
-def process_inline_formatting_html(text: str) -> str:
-    result = html.escape(text)
-    result = re.sub(r'\*\*\*(.+?)\*\*\*', r'<strong><em>\1</em></strong>', result)
-    result = re.sub(r'___(.+?)___', r'<strong><em>\1</em></strong>', result)
-    def handle_bold(m):
-        inner = m.group(1)
-        inner = re.sub(r'\*([^*]+)\*', r'<em>\1</em>', inner)
-        inner = re.sub(r'_([^_]+)_', r'<em>\1</em>', inner)
-        return f'<strong>{inner}</strong>'
-    result = re.sub(r'\*\*(.+?)\*\*', handle_bold, result)
-    result = re.sub(r'__(.+?)__', handle_bold, result)
-    result = re.sub(r'(?<!\*)\*([^*\n]+?)\*(?!\*)', r'<em>\1</em>', result)
-    result = re.sub(r'(?<!_)_([^_\n]+?)_(?!_)', r'<em>\1</em>', result)
-    result = re.sub(r'~~(.+?)~~', r'<del>\1</del>', result)
-    result = re.sub(r'`([^`]+)`', r'<code>\1</code>', result)
-    return result
-
-def parse_table_to_html(lines: List[str]) -> str:
-    rows = []
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith('|') and stripped.endswith('|'):
-            cells = [c.strip() for c in stripped.split('|')]
-            cells = cells[1:-1]
-            if cells and all(re.match(r'^[\-:\s]+$', cell) and '-' in cell for cell in cells):
-                continue
-            rows.append(cells)
+def segments_to_html(segments) -> str:
+    parts = []
+    for text, tags in segments:
+        opening = ''.join(INLINE_HTML_TAGS[t][0] for t in tags if t in INLINE_HTML_TAGS)
+        closing = ''.join(INLINE_HTML_TAGS[t][1] for t in reversed(tags) if t in INLINE_HTML_TAGS)
+        parts.append(f"{opening}{html.escape(text)}{closing}")
+    return ''.join(parts)
+
+
+def table_rows_to_html(rows: List[List[str]]) -> str:
     if not rows:
         return ""
     html_parts = ['<table border="1" cellpadding="5" cellspacing="0">']
@@ -346,41 +178,49 @@ def parse_table_to_html(lines: List[str]) -> str:
         html_parts.append("<tr>")
         tag = "th" if idx == 0 else "td"
         for cell in row:
-            content = process_inline_formatting_html(cell)
+            content = segments_to_html(InlineFormatter._parse_segments(cell))
             html_parts.append(f'<{tag}>{content}</{tag}>')
         html_parts.append("</tr>")
     html_parts.append("</table>")
     return ''.join(html_parts)
 
-def has_markdown_formatting(text: str) -> bool:
-    patterns = [
-        r'\*\*\*.+?\*\*\*',
-        r'___.+?___',
-        r'\*\*.+?\*\*',
-        r'__.+?__',
-        r'(?<![*\\])\*[^*\n]+?\*(?!\*)',
-        r'(?<![_\\])_[^_\n]+?_(?!_)',
-        r'~~.+?~~',
-        r'<u>.+?</u>',
-        r'`.+?`',
-        r'^#{1,6}\s+',
-        r'^\s*[-*+]\s+',
-        r'^\s*\d+\.\s+',
-        r'```',
-        r'^\|.+\|$',
-    ]
-    for pattern in patterns:
-        if re.search(pattern, text, re.MULTILINE):
-            return True
-    return False
-
 
-def strip_markdown(text: str) -> str:
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-    text = re.sub(r'<think>.*$', '', text, flags=re.DOTALL)
-    text = re.sub(r'</think>', '', text)
-    text = re.sub(r'<think>', '', text)
-    return text
+def document_to_html(doc: "RenderPlan") -> str:
+    html_parts = []
+    for block in doc.blocks:
+        if block.kind == "code":
+            code_content = '<br>'.join(html.escape(line) for line in block.lines)
+            # Word friendly code block style
+            html_parts.append(
+                f'<div style="background-color:#f0f0f0; padding:10px; border:1px solid #ccc; '
+                f'font-family:Consolas,monospace; font-size:10pt; white-space:pre-wrap;">'
+                f'{code_content}</div>'
+            )
+            continue
+        if block.kind == "table":
+            html_parts.append(table_rows_to_html(block.rows))
+            continue
+        list_type = None
+        for node in block.nodes:
+            wanted = "ul" if node.kind == "bullet" else "ol" if node.kind == "numbered" else None
+            if list_type and wanted != list_type:
+                html_parts.append(f"</{list_type}>")
+                list_type = None
+            if wanted and not list_type:
+                html_parts.append(f"<{wanted}>")
+                list_type = wanted
+            content = segments_to_html(node.segments)
+            if node.kind == "header":
+                html_parts.append(f'<h{node.level}>{content}</h{node.level}>')
+            elif wanted:
+                html_parts.append(f"<li>{content}</li>")
+            elif node.kind == "rule":
+                html_parts.append('<hr>')
+            elif node.kind == "paragraph":
+                html_parts.append(f"<p>{content}</p>")
+        if list_type:
+            html_parts.append(f"</{list_type}>")
+    return ''.join(html_parts)
 
 
 class Theme:
@@ -405,6 +245,12 @@ class Theme:
         "code_bg": "#161b22",
         "table_header": "#2d333b",
         "table_border": "#444c56",
+        "syntax_keyword": "#ff7b72",
+        "syntax_string": "#a5d6ff",
+        "syntax_comment": "#8b949e",
+        "syntax_number": "#79c0ff",
+        "syntax_builtin": "#d2a8ff",
+        "syntax_decorator": "#ffa657",
     }
     LIGHT = {
         "bg_primary": "#ffffff",
@@ -427,6 +273,12 @@ class Theme:
         "code_bg": "#f6f8fa",
         "table_header": "#f6f8fa",
         "table_border": "#d0d7de",
+        "syntax_keyword": "#cf222e",
+        "syntax_string": "#0a3069",
+        "syntax_comment": "#6e7781",
+        "syntax_number": "#0550ae",
+        "syntax_builtin": "#8250df",
+        "syntax_decorator": "#953800",
     }
 
     @classmethod
@@ -437,30 +289,124 @@ class Theme:
 class MarkdownParser:
     @staticmethod
     def clean_text(text: str) -> str:
-        text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-        text = re.sub(r'<think>.*$', '', text, flags=re.DOTALL)
-        text = re.sub(r'</think>', '', text)
-        text = re.sub(r'<think>', '', text)
-        return text.strip()
+        """Drop <think> blocks (an unclosed one runs to the end) and stray tags."""
+        think_filter = ThinkTagFilter()
+        return think_filter.feed(text) + think_filter.finish()
 
     @staticmethod
-    def parse_table_rows(lines: List[str]) -> List[List[str]]:
-        rows = []
-        for line in lines:
-            # More robust separator detection - matches |---|, |:---|, |---:|, |:---:|
-            # Check if all cells contain only dashes, colons, and spaces
-            stripped = line.strip()
-            if stripped.startswith('|') and stripped.endswith('|'):
-                # Extract cells and check if it's a separator row
-                cells = [c.strip() for c in stripped.split('|')]
-                cells = cells[1:-1]  # Remove empty first/last from split
-                if cells and all(re.match(r'^[:\-\s]+$', cell) and '-' in cell for cell in cells):
-                    continue  # Skip separator row
-            # Regular row processing
-            cells = [c.strip() for c in line.strip().split('|')]
-            if len(cells) > 2:
-                rows.append(cells[1:-1])
-        return rows
+    def parse_table_row(line: str) -> Optional[List[str]]:
+        """Cells of one table line, or None for separator and malformed lines."""
+        # More robust separator detection - matches |---|, |:---|, |---:|, |:---:|
+        # Check if all cells contain only dashes, colons, and spaces
+        stripped = line.strip()
+        if stripped.startswith('|') and stripped.endswith('|'):
+            # Extract cells and check if it's a separator row
+            cells = [c.strip() for c in stripped.split('|')]
+            cells = cells[1:-1]  # Remove empty first/last from split
+            if cells and all(re.match(r'^[:\-\s]+$', cell) and '-' in cell for cell in cells):
+                return None  # Skip separator row
+        # Regular row processing
+        cells = [c.strip() for c in stripped.split('|')]
+        if len(cells) > 2:
+            return cells[1:-1]
+        return None
+
+class ThinkTagFilter:
+    """Incremental MarkdownParser.clean_text for streamed text: feed() returns
+    only the newly visible part. Text that could still turn into a tag, and
+    trailing whitespace, is held back until the next chunk decides it, so the
+    concatenated output always equals clean_text() of everything fed. What is
+    inside think blocks is kept apart as reasoning; take_reasoning() hands out
+    the part that arrived since the last call."""
+    TAG = re.compile(r'</?think>')
+    OPEN = "<think>"
+    CLOSE = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+        self._started = False  # Leading whitespace has been stripped
+        self._pending_ws = ""
+        self._reasoning: List[str] = []
+        self._reasoned = False  # Some reasoning has been seen; later blocks get a separator
+
+    def feed(self, text: str) -> str:
+        buffer = self._buffer + text
+        out = []
+        pos = 0
+        while True:
+            if self._inside:
+                end = buffer.find(self.CLOSE, pos)
+                if end < 0:
+                    keep = self._partial_tag(buffer, pos, self.CLOSE)
+                    self._think(buffer[pos:len(buffer) - keep])
+                    pos = len(buffer) - keep
+                    break
+                self._think(buffer[pos:end])
+                self._inside = False
+                pos = end + len(self.CLOSE)
+                continue
+            match = self.TAG.search(buffer, pos)
+            if match is None:
+                keep = max(self._partial_tag(buffer, pos, self.OPEN), self._partial_tag(buffer, pos, self.CLOSE))
+                self._emit(buffer[pos:len(buffer) - keep], out)
+                pos = len(buffer) - keep
+                break
+            self._emit(buffer[pos:match.start()], out)
+            self._inside = match.group() == self.OPEN
+            if self._inside and self._reasoned:
+                self._reasoning.append("\n\n")
+            pos = match.end()
+        self._buffer = buffer[pos:]
+        return "".join(out)
+
+    def finish(self) -> str:
+        """Flush what was held back; an unclosed think block is dropped."""
+        out = []
+        if self._inside:
+            self._think(self._buffer)
+        else:
+            self._emit(self._buffer, out)
+        self._buffer = ""
+        self._pending_ws = ""
+        return "".join(out)
+
+    def take_reasoning(self) -> str:
+        reasoning = "".join(self._reasoning)
+        self._reasoning.clear()
+        return reasoning
+
+    @staticmethod
+    def _partial_tag(buffer: str, pos: int, tag: str) -> int:
+        """Length of the longest suffix of buffer[pos:] that starts ``tag``."""
+        for size in range(min(len(tag) - 1, len(buffer) - pos), 0, -1):
+            if tag.startswith(buffer[len(buffer) - size:]):
+                return size
+        return 0
+
+    def _think(self, text: str):
+        if not self._reasoned:
+            text = text.lstrip()
+            if not text:
+                return
+            self._reasoned = True
+        if text:
+            self._reasoning.append(text)
+
+    def _emit(self, text: str, out: List[str]):
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+        stripped = text.rstrip()
+        if stripped:
+            out.append(self._pending_ws)
+            out.append(stripped)
+            self._pending_ws = text[len(stripped):]
+        else:
+            self._pending_ws += text
+
 
 class InlineFormatter:
     PATTERNS = [
@@ -476,11 +422,11 @@ class InlineFormatter:
         (re.compile(r'<u>(.+?)</u>'), 'underline'),
         (re.compile(r'`([^`]+)`'), 'inline_code'),
     ]
+    # A character every match of the pattern at the same position must contain
+    TRIGGERS = ['*', '_', '*', '_', '*', '_', '*', '_', '~', '<', '`']
+    NESTED_ITALIC = re.compile(r'\*([^*]+)\*|_([^_]+)_')
     @staticmethod
-    def render_line(text_widget: tk.Text, text: str, base_tags: tuple = ()):
-        if not text:
-            return
-        segments = InlineFormatter._parse_segments(text)
+    def insert_segments(text_widget: tk.Text, segments, base_tags: tuple = ()):
         for segment_text, segment_tags in segments:
             combined_tags = base_tags + segment_tags if segment_tags else base_tags
             if not combined_tags:
@@ -488,48 +434,55 @@ class InlineFormatter:
             text_widget.insert(tk.END, segment_text, combined_tags)
     @staticmethod
     def _parse_segments(text: str) -> List[tuple]:
+        """Split a line into (text, tags) segments in one left-to-right pass.
+
+        Each pattern keeps a cursor on its next match and the cursors are merged
+        by position, so matches are visited in (start, longest, pattern order)
+        order without collecting, sorting or pairwise overlap checks. A match is
+        taken when it starts at or after the end of the last one taken, which
+        gives the same leftmost-longest result as the pattern table implies.
+        """
+        patterns = InlineFormatter.PATTERNS
+        heap = []
+        for order, trigger in enumerate(InlineFormatter.TRIGGERS):
+            if trigger in text:
+                match = patterns[order][0].search(text)
+                if match:
+                    heap.append((match.start(), -match.end(), order, match))
+        if not heap:
+            return [(text, ())] if text else []
+        heapq.heapify(heap)
         segments = []
+        append = segments.append
+        heapreplace = heapq.heapreplace
         current_pos = 0
-        events = []
-        for pattern, tag in InlineFormatter.PATTERNS:
-            for match in pattern.finditer(text):
-                events.append((match.start(), match.end(), match.group(1), tag, match.group(0)))
-        events.sort(key=lambda x: (x[0], -x[1]))
-        used_ranges = []
-        filtered_events = []
-        for start, end, content, tag, full_match in events:
-            overlaps = False
-            for used_start, used_end in used_ranges:
-                if start < used_end and end > used_start:
-                    overlaps = True
-                    break
-            if not overlaps:
-                filtered_events.append((start, end, content, tag, full_match))
-                used_ranges.append((start, end))
-        filtered_events.sort(key=lambda x: x[0])
-        for start, end, content, tag, full_match in filtered_events:
-            if start > current_pos:
-                segments.append((text[current_pos:start], ()))
-            if tag == 'bold':
-                nested_segments = InlineFormatter._parse_nested_in_bold(content)
-                for nested_text, nested_tags in nested_segments:
-                    if nested_tags:
-                        combined = ('bold',) + nested_tags
-                        segments.append((nested_text, combined))
-                    else:
-                        segments.append((nested_text, ('bold',)))
+        while heap:
+            start, neg_end, order, match = heap[0]
+            end = -neg_end
+            if start >= current_pos:
+                if start > current_pos:
+                    append((text[current_pos:start], ()))
+                tag = patterns[order][1]
+                if tag == 'bold':
+                    for nested_text, nested_tags in InlineFormatter._parse_nested_in_bold(match.group(1)):
+                        append((nested_text, ('bold',) + nested_tags))
+                else:
+                    append((match.group(1), (tag,)))
+                current_pos = end
+            # Advance this pattern exactly as finditer would: from the end of its own match
+            following = patterns[order][0].search(text, end)
+            if following:
+                heapreplace(heap, (following.start(), -following.end(), order, following))
             else:
-                segments.append((content, (tag,)))
-            current_pos = end
+                heapq.heappop(heap)
         if current_pos < len(text):
-            segments.append((text[current_pos:], ()))
+            append((text[current_pos:], ()))
         return segments
     @staticmethod
     def _parse_nested_in_bold(text: str) -> List[tuple]:
         segments = []
-        italic_pattern = re.compile(r'\*([^*]+)\*|_([^_]+)_')
         current_pos = 0
-        for match in italic_pattern.finditer(text):
+        for match in InlineFormatter.NESTED_ITALIC.finditer(text):
             if match.start() > current_pos:
                 segments.append((text[current_pos:match.start()], ()))
             content = match.group(1) or match.group(2)
@@ -539,34 +492,264 @@ class InlineFormatter:
             segments.append((text[current_pos:], ()))
         return segments if segments else [(text, ())]
 
+def _syntax(keywords: str, builtins: str = "", comment: str = r'#.*', multiline: Optional[Dict] = None,
+            strings: str = r'"(?:[^"\\]|\\.)*"?|\'(?:[^\'\\]|\\.)*\'?', decorator: str = "", flags: int = 0):
+    """Compile one language's token pattern. ``multiline`` maps an opening
+    delimiter to (closing delimiter, token) for strings/comments that can span
+    lines; the lexer carries those across line ends."""
+    multiline = multiline or {}
+    parts = []
+    if multiline:
+        parts.append(r'(?P<open>' + '|'.join(re.escape(opener) for opener in multiline) + ')')
+    parts.append(rf'(?P<comment>{comment})')
+    parts.append(rf'(?P<string>{strings})')
+    if decorator:
+        parts.append(rf'(?P<decorator>{decorator})')
+    parts.append(r'(?P<number>\b(?:0[xX][0-9a-fA-F_]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)\b)')
+    parts.append(r'(?P<keyword>\b(?:' + '|'.join(keywords.split()) + r')\b)')
+    if builtins:
+        parts.append(r'(?P<builtin>\b(?:' + '|'.join(builtins.split()) + r')\b)')
+    return re.compile('|'.join(parts), flags), multiline
+
+
+C_FAMILY = _syntax(
+    "if else for while do switch case default break continue return goto try catch finally throw throws new "
+    "delete class struct enum union interface extends implements public private protected static const final "
+    "virtual override abstract namespace using import package include define typedef template typename auto "
+    "void int long short char float double bool boolean byte unsigned signed var let fn func go defer chan map "
+    "impl trait mut pub use mod match loop where self this super null nullptr true false async await yield "
+    "sizeof volatile extern inline operator friend readonly sealed lambda in is as",
+    "printf println print std string String Vec Option Result Some Ok Err List Map System console",
+    comment=r'//.*', multiline={"/*": ("*/", "comment")}, decorator=r'@\w+|#\s*\w+'
+)
+SYNTAX_LANGUAGES = {
+    "python": _syntax(
+        "and as assert async await break class continue def del elif else except finally for from global if "
+        "import in is lambda nonlocal not or pass raise return try while with yield match case None True False",
+        "print len range int str float list dict set tuple bool open super self cls isinstance enumerate zip "
+        "map filter sorted min max sum abs any all type object Exception",
+        multiline={'"""': ('"""', "string"), "'''": ("'''", "string")}, decorator=r'@[\w.]+'
+    ),
+    "javascript": _syntax(
+        "break case catch class const continue debugger default delete do else export extends finally for "
+        "function if import in instanceof let new return super switch this throw try typeof var void while "
+        "with yield async await of from as type interface enum implements public private protected readonly "
+        "null undefined true false",
+        "console window document Math JSON Object Array String Number Promise Map Set Error require module",
+        comment=r'//.*', multiline={"/*": ("*/", "comment"), "`": ("`", "string")}, decorator=r'@\w+'
+    ),
+    "c": C_FAMILY,
+    "shell": _syntax(
+        "if then else elif fi for while until do done case esac in function return local export unset "
+        "readonly shift exit break continue select time",
+        "echo cd ls cat grep sed awk mkdir rm cp mv chmod chown sudo pip python git curl source set test read",
+        decorator=r'\$\{?\w+\}?'
+    ),
+    "sql": _syntax(
+        "select from where and or not insert into values update set delete create table drop alter index "
+        "primary key foreign references join left right inner outer on as group by order having limit offset "
+        "union all distinct null is in like between case when then else end exists default unique view",
+        "count sum avg min max coalesce cast",
+        comment=r'--.*', multiline={"/*": ("*/", "comment")}, flags=re.IGNORECASE
+    ),
+}
+SYNTAX_ALIASES = {
+    "py": "python", "python3": "python", "js": "javascript", "jsx": "javascript", "ts": "javascript",
+    "tsx": "javascript", "typescript": "javascript", "json": "javascript", "node": "javascript",
+    "cpp": "c", "c++": "c", "h": "c", "hpp": "c", "cc": "c", "java": "c", "cs": "c", "csharp": "c", "c#": "c",
+    "go": "c", "golang": "c", "rust": "c", "rs": "c", "kotlin": "c", "kt": "c", "swift": "c", "scala": "c",
+    "dart": "c", "php": "c", "sh": "shell", "bash": "shell", "zsh": "shell", "console": "shell",
+    "powershell": "shell", "ps1": "shell", "ps": "shell", "bat": "shell", "cmd": "shell", "batch": "shell",
+}
+
+
+class SyntaxLexer:
+    """Regex line lexer for one code block. Lines are lexed in order, possibly
+    in several batches while a block streams in; the only state carried from
+    one line to the next is an open multi-line string or comment. Runs on the
+    highlight worker; the Tk thread only reads it once every batch is done."""
+
+    def __init__(self, language: str):
+        self.language = language
+        self.pattern, self.multiline = SYNTAX_LANGUAGES[language]
+        self.state: Optional[tuple] = None  # (closing delimiter, token) of an open span
+        self.spans: List[List[tuple]] = []  # (start, end, token) per lexed line
+
+    @staticmethod
+    def for_language(language: str) -> Optional["SyntaxLexer"]:
+        name = (language or "").strip().lower()
+        name = SYNTAX_ALIASES.get(name, name)
+        return SyntaxLexer(name) if name in SYNTAX_LANGUAGES else None
+
+    @staticmethod
+    def cache_key(language: str, lines: List[str]) -> str:
+        return language + "\n" + "\n".join(lines)
+
+    def lex(self, lines: List[str]) -> List[List[tuple]]:
+        spans = [self._lex_line(line) for line in lines]
+        self.spans.extend(spans)
+        return spans
+
+    def _lex_line(self, line: str) -> List[tuple]:
+        spans = []
+        pos = 0
+        if self.state:
+            closer, token = self.state
+            end = line.find(closer)
+            if end < 0:
+                return [(0, len(line), token)] if line else []
+            pos = end + len(closer)
+            spans.append((0, pos, token))
+            self.state = None
+        while True:
+            match = self.pattern.search(line, pos)
+            if match is None:
+                return spans
+            kind = match.lastgroup
+            if kind == "open":
+                closer, token = self.multiline[match.group()]
+                end = line.find(closer, match.end())
+                if end < 0:
+                    spans.append((match.start(), len(line), token))
+                    self.state = (closer, token)
+                    return spans
+                pos = end + len(closer)
+                spans.append((match.start(), pos, token))
+            else:
+                pos = match.end()
+                spans.append((match.start(), pos, kind))
+
+
+SYNTAX_TOKENS = ("keyword", "string", "comment", "number", "builtin", "decorator")
+
+
 class CodeBlockWidget(tk.Frame):
-    def __init__(self, master, theme: Dict, code: str, language: str = ""):
+    MAX_DISPLAY_LINES = 20
+
+    def __init__(self, master, theme: Dict, code: str, language: str = "", fonts: Optional[Dict] = None):
         super().__init__(master, bg=theme["code_bg"], highlightbackground=theme["border"], highlightthickness=1)
+        fonts = fonts or FONT_SPECS
         self.theme = theme
-        self.code = code
+        self._lines: List[str] = []
+        self._tail = ""
         self.columnconfigure(0, weight=1)
         header = tk.Frame(self, bg=theme["bg_tertiary"])
         header.grid(row=0, column=0, sticky="ew")
         header.columnconfigure(0, weight=1)
-        tk.Label(
-            header, text=language if language else "code", font=("Consolas", 9),
+        self.language_label = tk.Label(
+            header, text=language if language else "code", font=fonts["code_label"],
             fg=theme["text_muted"], bg=theme["bg_tertiary"], anchor="w", padx=8
-        ).grid(row=0, column=0, sticky="w", pady=2)
+        )
+        self.language_label.grid(row=0, column=0, sticky="w", pady=2)
         self.copy_btn = tk.Button(
-            header, text="Copy", font=("Segoe UI", 8), bg=theme["accent"], fg="white",
+            header, text="Copy", font=fonts["code_button"], bg=theme["accent"], fg="white",
             bd=0, padx=8, pady=1, cursor="hand2", activebackground=theme["accent_hover"],
             command=self._copy_code
         )
         self.copy_btn.grid(row=0, column=1, sticky="e", padx=4, pady=2)
-        line_count = code.count('\n') + 1
-        display_height = min(max(line_count, 1), 20)
         self.text_widget = tk.Text(
-            self, wrap=tk.NONE, font=("Consolas", 10), bg=theme["code_bg"], fg=theme["text_primary"],
-            relief=tk.FLAT, bd=0, padx=8, pady=6, height=display_height, cursor="arrow", highlightthickness=0
+            self, wrap=tk.NONE, font=fonts["code"], bg=theme["code_bg"], fg=theme["text_primary"],
+            relief=tk.FLAT, bd=0, padx=8, pady=6, height=1, cursor="arrow", highlightthickness=0
         )
         self.text_widget.grid(row=1, column=0, sticky="ew")
-        self.text_widget.insert("1.0", code)
+        self.text_widget.mark_set("tail", "1.0")
+        self.text_widget.mark_gravity("tail", "left")
+        for token in SYNTAX_TOKENS:
+            self.text_widget.tag_configure(f"syn_{token}", foreground=theme[f"syntax_{token}"])
+        self._lexer = SyntaxLexer.for_language(language)
+        if code:
+            self.append_lines(code.split('\n'))
+
+    @property
+    def code(self) -> str:
+        return '\n'.join(self._lines)
+
+    def reset(self, language: str = ""):
+        """Empty the block so a pooled widget can show another one."""
+        self._cache_highlight()
+        self._lexer = SyntaxLexer.for_language(language)
+        self.language_label.configure(text=language if language else "code")
+        self.text_widget.configure(state=tk.NORMAL)
+        self.text_widget.delete("1.0", "end")
+        self.text_widget.mark_set("tail", "1.0")
+        self._lines = []
+        self._tail = ""
+        self._update_height()
+
+    def append_lines(self, lines: List[str]):
+        """Append finished lines; anything shown as a provisional tail is replaced."""
+        if not lines:
+            return
+        self.text_widget.configure(state=tk.NORMAL)
+        self.text_widget.delete("tail", "end")
+        self._tail = ""
+        prefix = "\n" if self._lines else ""
+        self.text_widget.insert(tk.END, prefix + '\n'.join(lines))
+        self.text_widget.mark_set("tail", "end-1c")
         self.text_widget.configure(state=tk.DISABLED)
+        first_line = len(self._lines) + 1
+        self._lines.extend(lines)
+        self._update_height()
+        self._highlight(lines, first_line)
+
+    def _highlight(self, lines: List[str], first_line: int):
+        """Colour newly appended lines: from the cache when the whole block was
+        seen before, otherwise lexed on the highlight worker."""
+        lexer = self._lexer
+        if lexer is None:
+            return
+        if first_line == 1:
+            cached = HIGHLIGHT_CACHE.get(SyntaxLexer.cache_key(lexer.language, lines))
+            if cached is not None:
+                lexer.spans, lexer.state = list(cached[0]), cached[1]
+                self._apply_spans(cached[0], 1)
+                return
+        HIGHLIGHT_WORKER.submit(
+            (lexer, lines, first_line),
+            lambda result: self._post_spans(lexer, *result),
+            lambda: self._lexer is lexer
+        )
+
+    def _post_spans(self, lexer: SyntaxLexer, spans: List[List[tuple]], first_line: int):
+        try:
+            self.after(0, lambda: self._on_spans(lexer, spans, first_line))
+        except:
+            pass  # Widget destroyed while the lexer ran
+
+    def _on_spans(self, lexer: SyntaxLexer, spans: List[List[tuple]], first_line: int):
+        if self._lexer is lexer:
+            self._apply_spans(spans, first_line)
+
+    def _apply_spans(self, spans: List[List[tuple]], first_line: int):
+        # One tag_add per token type for the whole batch
+        ranges: Dict[str, List[str]] = {}
+        for line_no, line_spans in enumerate(spans, first_line):
+            for start, end, token in line_spans:
+                ranges.setdefault(token, []).extend((f"{line_no}.{start}", f"{line_no}.{end}"))
+        for token, indices in ranges.items():
+            self.text_widget.tag_add(f"syn_{token}", *indices)
+
+    def _cache_highlight(self):
+        """Remember a fully lexed block, so showing it again costs no lexing."""
+        lexer = self._lexer
+        if lexer is not None and self._lines and len(lexer.spans) == len(self._lines):
+            HIGHLIGHT_CACHE.put(SyntaxLexer.cache_key(lexer.language, self._lines), (lexer.spans, lexer.state))
+
+    def set_tail(self, text: str):
+        """Show the line that is still streaming in without committing it."""
+        if text == self._tail:
+            return
+        self.text_widget.configure(state=tk.NORMAL)
+        self.text_widget.delete("tail", "end")
+        if text:
+            self.text_widget.insert(tk.END, ("\n" if self._lines else "") + text)
+        self.text_widget.configure(state=tk.DISABLED)
+        self._tail = text
+        self._update_height()
+
+    def _update_height(self):
+        line_count = len(self._lines) + (1 if self._tail else 0)
+        self.text_widget.configure(height=min(max(line_count, 1), self.MAX_DISPLAY_LINES))
 
     def _copy_code(self):
         self.clipboard_clear()
@@ -576,335 +759,1771 @@ class CodeBlockWidget(tk.Frame):
 
 
 class TableWidget(tk.Frame):
-    def __init__(self, master, theme: Dict, rows: List[List[str]]):
+    """A markdown table drawn as tab-separated lines in one Text widget, so the
+    widget count does not grow with the cell count. Column widths are measured
+    once per distinct cell and turned into tab stops; rows are appended as
+    they stream in. Tall tables scroll inside a fixed height, and Tk only lays
+    out the lines that are on screen."""
+    MAX_DISPLAY_ROWS = 25
+    CELL_PADDING = 20  # Pixels between columns
+
+    def __init__(self, master, theme: Dict, rows: List[List[str]], fonts: Optional[Dict] = None):
         super().__init__(master, bg=theme["table_border"])
         self.theme = theme
-        if not rows:
+        fonts = fonts or FONT_SPECS
+        self.fonts = {
+            name: font if isinstance(font, tkfont.Font) else tkfont.Font(root=self, font=font)
+            for name, font in ((name, fonts[name]) for name in ("table", "table_header"))
+        }
+        self._rows: List[tuple] = []
+        self._widths: List[int] = []
+        self._measured: Dict[tuple, int] = {}
+        self.columnconfigure(0, weight=1)
+        self.text_widget = tk.Text(
+            self, wrap=tk.NONE, font=self.fonts["table"], bg=theme["bg_tertiary"], fg=theme["text_primary"],
+            relief=tk.FLAT, bd=0, padx=10, pady=0, height=1, cursor="arrow", highlightthickness=0,
+            spacing1=6, spacing3=6
+        )
+        self.text_widget.grid(row=0, column=0, sticky="ew", padx=1, pady=1)
+        self.text_widget.tag_configure("header", font=self.fonts["table_header"], background=theme["table_header"])
+        self.text_widget.tag_configure("row_alt", background=theme["bg_secondary"])
+        self.y_scrollbar = tk.Scrollbar(self, orient="vertical", command=self.text_widget.yview)
+        self.x_scrollbar = tk.Scrollbar(self, orient="horizontal", command=self.text_widget.xview)
+        self.text_widget.configure(yscrollcommand=self._scroll_setter(self.y_scrollbar, row=0, column=1, sticky="ns"),
+                                   xscrollcommand=self._scroll_setter(self.x_scrollbar, row=1, column=0, sticky="ew"))
+        self.set_rows(rows)
+
+    @staticmethod
+    def _scroll_setter(scrollbar: tk.Scrollbar, **grid_options) -> Callable:
+        """yscrollcommand/xscrollcommand that only shows the bar when it is needed."""
+        def update(first, last):
+            if float(first) <= 0.0 and float(last) >= 1.0:
+                scrollbar.grid_remove()
+            else:
+                scrollbar.grid(**grid_options)
+            scrollbar.set(first, last)
+        return update
+
+    def set_rows(self, rows: List[List[str]]):
+        """Show ``rows``. A streaming table only ever gains rows, so when the
+        rows on screen are still a prefix only the new ones are inserted."""
+        keep = len(self._rows)
+        if not (keep <= len(rows) and (keep == 0 or (tuple(rows[0]) == self._rows[0]
+                                                     and tuple(rows[keep - 1]) == self._rows[-1]))):
+            keep = 0
+        num_cols = max((len(r) for r in rows), default=0)
+        if num_cols != len(self._widths):
+            keep = 0  # Every line needs a tab per column
+        text = self.text_widget
+        text.configure(state=tk.NORMAL)
+        if keep == 0:
+            text.delete("1.0", "end")
+            self._rows = []
+            self._widths = [0] * num_cols
+            if len(self._measured) > 4096:
+                self._measured.clear()
+        widened = False
+        for row_idx in range(keep, len(rows)):
+            row = tuple(rows[row_idx])
+            self._rows.append(row)
+            font = "table_header" if row_idx == 0 else "table"
+            for col, cell in enumerate(row):
+                width = self._measure(cell, font)
+                if width > self._widths[col]:
+                    self._widths[col] = width
+                    widened = True
+            if row_idx:
+                # A row's background runs to the right edge only if its newline carries the tag
+                text.insert(tk.END, "\n", self._row_tags(row_idx - 1))
+            text.insert(tk.END, "\t".join(row), self._row_tags(row_idx))
+        text.configure(state=tk.DISABLED)
+        if widened or keep == 0:
+            stops, position = [], 0
+            for width in self._widths[:-1]:
+                position += width + self.CELL_PADDING
+                stops.append(position)
+            text.configure(tabs=tuple(stops))
+        text.configure(height=max(1, min(len(rows), self.MAX_DISPLAY_ROWS)))
+
+    @staticmethod
+    def _row_tags(row_idx: int) -> tuple:
+        return ("header",) if row_idx == 0 else ("row_alt",) if row_idx % 2 == 0 else ()
+
+    def _measure(self, cell: str, font: str) -> int:
+        key = (cell, font)
+        width = self._measured.get(key)
+        if width is None:
+            width = self._measured[key] = self.fonts[font].measure(cell)
+        return width
+
+
+FONT_SPECS = {
+    "normal": ("Segoe UI", 11),
+    "bold": ("Segoe UI", 11, "bold"),
+    "italic": ("Segoe UI", 11, "italic"),
+    "bold_italic": ("Segoe UI", 11, "bold", "italic"),
+    "underline": ("Segoe UI", 11, "underline"),
+    "strikethrough": ("Segoe UI", 11, "overstrike"),
+    "inline_code": ("Consolas", 10),
+    "h1": ("Segoe UI", 18, "bold"),
+    "h2": ("Segoe UI", 16, "bold"),
+    "h3": ("Segoe UI", 14, "bold"),
+    "h4": ("Segoe UI", 13, "bold"),
+    "h5": ("Segoe UI", 12, "bold"),
+    "h6": ("Segoe UI", 11, "bold"),
+    "code": ("Consolas", 10),
+    "code_label": ("Consolas", 9),
+    "code_button": ("Segoe UI", 8),
+    "table": ("Segoe UI", 10),
+    "table_header": ("Segoe UI", 10, "bold"),
+}
+
+
+class TextStyles:
+    """Named fonts and the Text tag registry shared by every rendered message.
+    Built once per window, so new Text widgets get tags that point at existing
+    fonts instead of allocating fresh font tuples each time."""
+
+    def __init__(self, master, theme: Dict):
+        self.fonts = {name: tkfont.Font(root=master, font=spec) for name, spec in FONT_SPECS.items()}
+        fonts = self.fonts
+        self.tags: Dict[str, Dict] = {
+            "normal": {"font": fonts["normal"]},
+            "bold": {"font": fonts["bold"]},
+            "italic": {"font": fonts["italic"]},
+            "bold_italic": {"font": fonts["bold_italic"]},
+            "underline": {"font": fonts["underline"]},
+            "strikethrough": {"font": fonts["strikethrough"]},
+            "inline_code": {"font": fonts["inline_code"], "background": theme["code_bg"]},
+            "bullet": {"lmargin1": 15, "lmargin2": 30},
+            "bullet1": {"lmargin1": 35, "lmargin2": 50},
+            "bullet2": {"lmargin1": 55, "lmargin2": 70},
+            "numbered": {"lmargin1": 15, "lmargin2": 30},
+        }
+        for level in range(1, 7):
+            self.tags[f"h{level}"] = {"font": fonts[f"h{level}"], "foreground": theme["accent_blue"]}
+
+    def configure_tags(self, text_widget: tk.Text):
+        for tag, options in self.tags.items():
+            text_widget.tag_configure(tag, **options)
+
+
+def fit_text_height(text_widget: tk.Text):
+    """Size a wrapping Text to its display lines at its current width, so long
+    paragraphs are not cut off. Rerun when the width changes."""
+    count = text_widget.count("1.0", "end", "displaylines")
+    lines = count[0] if isinstance(count, tuple) else count
+    height = max(1, lines or 1)
+    if text_widget.cget("height") != height:
+        text_widget.configure(height=height)
+
+
+class BlockWidgetPool:
+    """Idle Text, code-block and table widgets shared by the renderers of one
+    window. Pooled widgets are children of ``host`` and are packed into a
+    renderer's frame with ``in_``, so they can move between messages instead
+    of being destroyed and rebuilt."""
+    LIMIT = 24  # Idle widgets kept per kind
+
+    def __init__(self, host, theme: Dict):
+        self.host = host
+        self.theme = theme
+        self.styles = TextStyles(host, theme)
+        self._idle: Dict[str, List[tk.Widget]] = {"text": [], "code": [], "table": [], "collapsed": []}
+        self.stats = {"created": 0, "reused": 0, "destroyed": 0}
+
+    def acquire(self, kind: str, bg: str = "", language: str = "") -> tk.Widget:
+        idle = self._idle[kind]
+        if idle:
+            widget = idle.pop()
+            self.stats["reused"] += 1
+        else:
+            widget = self._create(kind)
+            self.stats["created"] += 1
+        if kind == "text":
+            widget.configure(state=tk.NORMAL, bg=bg, height=1)
+            widget.delete("1.0", "end")
+            widget.mark_set("tail", "1.0")
+        elif kind == "code":
+            widget.reset(language)
+        widget.lift()
+        return widget
+
+    def release(self, widget: tk.Widget):
+        widget.pack_forget()
+        if isinstance(widget, CodeBlockWidget):
+            idle = self._idle["code"]
+        elif isinstance(widget, TableWidget):
+            idle = self._idle["table"]
+        elif isinstance(widget, tk.Button):
+            idle = self._idle["collapsed"]
+        else:
+            idle = self._idle["text"]
+        if len(idle) < self.LIMIT:
+            idle.append(widget)
+        else:
+            widget.destroy()
+            self.stats["destroyed"] += 1
+
+    def _create(self, kind: str) -> tk.Widget:
+        fonts = self.styles.fonts
+        if kind == "code":
+            return CodeBlockWidget(self.host, self.theme, "", fonts=fonts)
+        if kind == "table":
+            return TableWidget(self.host, self.theme, [], fonts=fonts)
+        if kind == "collapsed":
+            # Stands in for a huge code block or table until it is clicked open
+            return tk.Button(
+                self.host, font=fonts["code_label"], fg=self.theme["text_secondary"], bg=self.theme["bg_tertiary"],
+                activebackground=self.theme["border"], bd=0, padx=10, pady=6, anchor="w", cursor="hand2"
+            )
+        text = tk.Text(
+            self.host, wrap=tk.WORD, relief=tk.FLAT, bd=0, fg=self.theme["text_primary"],
+            font=fonts["normal"], cursor="arrow", padx=0, pady=0, highlightthickness=0, height=1
+        )
+        self.styles.configure_tags(text)
+        text.mark_set("tail", "1.0")
+        text.mark_gravity("tail", "left")
+        # Re-wrapped at a new width: only happens to texts in messages on screen
+        text.bind("<Configure>", lambda e: fit_text_height(text))
+        return text
+
+
+class MarkdownLine(NamedTuple):
+    """One parsed line of a text block. ``segments`` are InlineFormatter
+    (text, tags) pairs; ``level`` is the header level or bullet indent."""
+    kind: str  # header, bullet, numbered, rule, paragraph or blank
+    segments: tuple
+    level: int = 0
+    marker: str = ""
+
+    @property
+    def has_formatting(self) -> bool:
+        return self.kind in ("header", "bullet", "numbered") or any(tags for _, tags in self.segments)
+
+
+class BlockPlan(NamedTuple):
+    """Immutable view of a MarkdownBlock at one point of the stream."""
+    kind: str
+    lang: str
+    lines: tuple
+    nodes: tuple
+    rows: tuple
+    closed: bool
+
+
+class MarkdownBlock:
+    """A run of text lines, a fenced code block or a table. Lines are only ever
+    appended and a closed block never changes again."""
+    __slots__ = ("kind", "lang", "lines", "nodes", "rows", "closed", "_snapshot")
+
+    def __init__(self, kind: str, lang: str = ""):
+        self.kind = kind
+        self.lang = lang
+        self.lines: List[str] = []
+        self.nodes: List[MarkdownLine] = []  # Text blocks: one parsed node per line
+        self.rows: List[List[str]] = []  # Tables: cells per row, separator rows dropped
+        self.closed = False
+        self._snapshot: Optional[BlockPlan] = None
+
+    def snapshot(self) -> "BlockPlan":
+        """Frozen copy for a render plan; reused until the block changes."""
+        snap = self._snapshot
+        if snap is None or snap.closed != self.closed or len(snap.lines) != len(self.lines):
+            snap = self._snapshot = BlockPlan(self.kind, self.lang, tuple(self.lines), tuple(self.nodes),
+                                              tuple(tuple(row) for row in self.rows), self.closed)
+        return snap
+
+    def add_line(self, line: str):
+        self.lines.append(line)
+        if self.kind == "text":
+            self.nodes.append(MarkdownBlockParser.parse_line(line))
+        elif self.kind == "table":
+            row = MarkdownParser.parse_table_row(line)
+            if row is not None:
+                self.rows.append(row)
+
+
+class MarkdownBlockParser:
+    """Incremental block-level parser producing the markdown AST shared by the
+    Tk renderer, HTML export and formatting detection. Complete lines are
+    parsed exactly once; only the unterminated last line (``tail``) is
+    provisional."""
+    HEADER = re.compile(r'^(#{1,6})\s+(.+)$')
+    BULLET = re.compile(r'^(\s*)([-*+])\s+(.+)$')
+    NUMBERED = re.compile(r'^(\s*)(\d+\.)\s+(.+)$')
+
+    def __init__(self):
+        self.blocks: List[MarkdownBlock] = []
+        self.tail = ""
+        self.finished = False
+        self.has_formatting = False
+
+    @staticmethod
+    def parse_line(line: str) -> MarkdownLine:
+        header_match = MarkdownBlockParser.HEADER.match(line)
+        if header_match:
+            return MarkdownLine("header", tuple(InlineFormatter._parse_segments(header_match.group(2))),
+                                len(header_match.group(1)))
+        bullet_match = MarkdownBlockParser.BULLET.match(line)
+        if bullet_match:
+            return MarkdownLine("bullet", tuple(InlineFormatter._parse_segments(bullet_match.group(3))),
+                                len(bullet_match.group(1)) // 2)
+        num_match = MarkdownBlockParser.NUMBERED.match(line)
+        if num_match:
+            return MarkdownLine("numbered", tuple(InlineFormatter._parse_segments(num_match.group(3))),
+                                marker=num_match.group(2))
+        if not line.strip():
+            return MarkdownLine("blank", ())
+        if line.strip() in ('---', '***', '___'):
+            return MarkdownLine("rule", ((line, ()),))
+        return MarkdownLine("paragraph", tuple(InlineFormatter._parse_segments(line)))
+
+    @property
+    def open_block(self) -> Optional[MarkdownBlock]:
+        if self.blocks and not self.blocks[-1].closed:
+            return self.blocks[-1]
+        return None
+
+    def feed(self, text: str):
+        if not text:
             return
-        num_cols = max(len(r) for r in rows) if rows else 0
-        if num_cols == 0:
+        self.tail += text
+        if '\n' in text:
+            *lines, self.tail = self.tail.split('\n')
+            for line in lines:
+                self._consume(line)
+
+    def finish(self):
+        if self.tail:
+            self._consume(self.tail)
+            self.tail = ""
+        for block in self.blocks:
+            block.closed = True
+        self.finished = True
+
+    def tail_kind(self) -> Optional[str]:
+        """Block kind the provisional tail will most likely land in."""
+        if not self.tail:
+            return None
+        block = self.open_block
+        if block and block.kind == "code":
+            return "code"
+        stripped = self.tail.strip()
+        if stripped.startswith('```') or stripped.startswith('|'):
+            return None  # Wait for the line to complete before opening a block
+        return "text"
+
+    def tail_has_formatting(self) -> bool:
+        stripped = self.tail.strip()
+        if stripped.startswith('```') or (stripped.startswith('|') and stripped.endswith('|') and len(stripped) > 1):
+            return True
+        return bool(self.tail) and self.parse_line(self.tail).has_formatting
+
+    def _consume(self, line: str):
+        block = self.open_block
+        stripped = line.strip()
+        if block and block.kind == "code":
+            if stripped.startswith('```'):
+                block.closed = True
+            else:
+                block.add_line(line)
             return
-        for col in range(num_cols):
-            self.columnconfigure(col, weight=1)
-        for row_idx, row in enumerate(rows):
-            is_header = row_idx == 0
-            for col_idx in range(num_cols):
-                cell_text = row[col_idx] if col_idx < len(row) else ""
-                bg_color = theme["table_header"] if is_header else theme["bg_tertiary"]
-                font_style = ("Segoe UI", 10, "bold") if is_header else ("Segoe UI", 10)
-                cell_frame = tk.Frame(self, bg=bg_color, highlightbackground=theme["table_border"], highlightthickness=1)
-                cell_frame.grid(row=row_idx, column=col_idx, sticky="nsew", padx=0, pady=0)
-                cell_label = tk.Label(
-                    cell_frame, text=cell_text, font=font_style, bg=bg_color, fg=theme["text_primary"],
-                    padx=10, pady=6, anchor="w", justify="left"
+        if block and block.kind == "table":
+            if stripped.startswith('|'):
+                block.add_line(line)
+                return
+            block.closed = True
+            block = None
+        if stripped.startswith('```'):
+            if block:
+                block.closed = True
+            self.blocks.append(MarkdownBlock("code", stripped[3:].strip()))
+            self.has_formatting = True
+        elif stripped.startswith('|') and stripped.endswith('|'):
+            if block:
+                block.closed = True
+            table = MarkdownBlock("table")
+            table.add_line(line)
+            self.blocks.append(table)
+            self.has_formatting = True
+        else:
+            if block is None:
+                block = MarkdownBlock("text")
+                self.blocks.append(block)
+            block.add_line(line)
+            if not self.has_formatting and block.nodes[-1].has_formatting:
+                self.has_formatting = True
+
+
+class RenderPlan:
+    """Immutable snapshot of a parse, safe to hand from a worker thread to the
+    Tk thread: frozen blocks, the provisional tail (already parsed) and flags.
+    A finished plan also carries the cleaned text and the reasoning that was
+    filtered out of it; it is what the cache holds."""
+    __slots__ = ("generation", "blocks", "tail", "tail_kind", "tail_node", "has_formatting", "finished", "text",
+                 "reasoning")
+
+    def __init__(self, parser: MarkdownBlockParser, generation: int = 0, text: str = "", reasoning: str = ""):
+        self.generation = generation
+        self.blocks = tuple(block.snapshot() for block in parser.blocks)
+        self.tail = parser.tail
+        self.tail_kind = parser.tail_kind()
+        self.tail_node = MarkdownBlockParser.parse_line(parser.tail) if self.tail_kind == "text" else None
+        self.has_formatting = parser.has_formatting or parser.tail_has_formatting()
+        self.finished = parser.finished
+        self.text = text
+        self.reasoning = reasoning
+
+    @property
+    def open_block(self) -> Optional[BlockPlan]:
+        if self.blocks and not self.blocks[-1].closed:
+            return self.blocks[-1]
+        return None
+
+
+EMPTY_PLAN = RenderPlan(MarkdownBlockParser())
+
+
+class StreamParser:
+    """Think-tag filtering and block parsing for one streamed reply. Meant to
+    run on the stream's worker thread: feed() returns the newly visible text,
+    the new reasoning and a RenderPlan of everything so far, so the Tk thread
+    only draws."""
+
+    def __init__(self):
+        self.filter = ThinkTagFilter()
+        self.parser = MarkdownBlockParser()
+        self.generation = 0
+        self._parts: List[str] = []
+        self._reasoning: List[str] = []
+
+    def feed(self, raw: str):
+        cleaned = self.filter.feed(raw)
+        if cleaned:
+            self.parser.feed(cleaned)
+            self._parts.append(cleaned)
+        return cleaned, self._take_reasoning(), self.plan()
+
+    def finish(self):
+        cleaned = self.filter.finish()
+        if cleaned:
+            self.parser.feed(cleaned)
+            self._parts.append(cleaned)
+        self.parser.finish()
+        reasoning = self._take_reasoning()
+        return cleaned, reasoning, self.plan("".join(self._parts), "".join(self._reasoning).rstrip())
+
+    def _take_reasoning(self) -> str:
+        reasoning = self.filter.take_reasoning()
+        if reasoning:
+            self._reasoning.append(reasoning)
+        return reasoning
+
+    def plan(self, text: str = "", reasoning: str = "") -> RenderPlan:
+        self.generation += 1
+        return RenderPlan(self.parser, self.generation, text, reasoning)
+
+
+class MarkdownCache:
+    """LRU of parsed documents keyed by a hash of the raw message text, so a
+    message is parsed once however often it is shown, copied or inspected."""
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._docs: "OrderedDict[bytes, RenderPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def get(self, text: str) -> Optional[RenderPlan]:
+        key = self.key(text)
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+            return doc
+
+    def put(self, text: str, doc: RenderPlan):
+        key = self.key(text)
+        with self._lock:
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            while len(self._docs) > self.capacity:
+                self._docs.popitem(last=False)
+
+
+MARKDOWN_CACHE = MarkdownCache()
+
+
+def parse_markdown(text: str) -> RenderPlan:
+    """Parse a raw message (think tags and all) into its cached, finished plan."""
+    doc = MARKDOWN_CACHE.get(text)
+    if doc is None:
+        think_filter = ThinkTagFilter()
+        cleaned = think_filter.feed(text) + think_filter.finish()
+        parser = MarkdownBlockParser()
+        parser.feed(cleaned)
+        parser.finish()
+        doc = RenderPlan(parser, text=cleaned, reasoning=think_filter.take_reasoning().rstrip())
+        MARKDOWN_CACHE.put(text, doc)
+    return doc
+
+
+class MarkdownParseWorker:
+    """Background thread that parses long messages into the cache, so opening
+    or re-laying out a huge reply never blocks the Tk thread. A job is skipped
+    if ``is_current`` says its renderer has moved on before it ran."""
+
+    def __init__(self):
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, text: str, on_done: Callable[[RenderPlan], None], is_current: Callable[[], bool]):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._jobs.put((text, on_done, is_current))
+
+    def _run(self):
+        while True:
+            text, on_done, is_current = self._jobs.get()
+            if not is_current():
+                continue
+            try:
+                on_done(self.work(text))
+            except Exception as e:
+                print(f"{type(self).__name__} error: {e}")
+
+    def work(self, text: str):
+        return parse_markdown(text)
+
+
+class HighlightWorker(MarkdownParseWorker):
+    """Lexes code block lines off the Tk thread. Jobs run in submission order,
+    so a block's batches see the state its previous batch left behind."""
+
+    def work(self, job: tuple):
+        lexer, lines, first_line = job
+        spans = lexer.lex(lines)
+        if first_line == 1:
+            HIGHLIGHT_CACHE.put(SyntaxLexer.cache_key(lexer.language, lines), (list(lexer.spans), lexer.state))
+        return spans, first_line
+
+
+PARSE_WORKER = MarkdownParseWorker()
+HIGHLIGHT_WORKER = HighlightWorker()
+HIGHLIGHT_CACHE = MarkdownCache(capacity=128)  # (spans per line, end state) by language and code
+
+
+class _BlockView:
+    """Widget state for one block of the plan: how many of its lines are on
+    screen, whether a provisional tail line is currently shown and whether the
+    widget is only a collapsed placeholder."""
+    __slots__ = ("block", "widget", "lines", "tail", "collapsed")
+
+    def __init__(self, block: Optional[BlockPlan], widget: tk.Widget, collapsed: bool = False):
+        self.block = block
+        self.widget = widget
+        self.lines = 0
+        self.tail = False
+        self.collapsed = collapsed
+
+
+class ReasoningSection(tk.Frame):
+    """Collapsed strip above a reply holding the model's reasoning. Until it is
+    opened the text is only kept as parts; the Text widget is created then."""
+    MAX_LINES = 14
+
+    def __init__(self, master, theme: Dict, bg: str):
+        super().__init__(master, bg=bg)
+        self.theme = theme
+        self._parts: List[str] = []
+        self._words = 0
+        self._lines = 1
+        self._last_char = " "
+        self._thinking = False
+        self._expanded = False
+        self.text_widget: Optional[tk.Text] = None
+        self.header = tk.Label(self, font=("Segoe UI", 9, "italic"), fg=theme["text_muted"], bg=bg,
+                               anchor="w", cursor="hand2")
+        self.header.pack(fill="x")
+        self.header.bind("<Button-1>", lambda e: self.toggle())
+        self._update_header()
+
+    @property
+    def has_text(self) -> bool:
+        return bool(self._parts)
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._parts.append(text)
+        words = len(text.split())
+        if words and not self._last_char.isspace() and not text[0].isspace():
+            words -= 1  # A word split across two deltas
+        self._words += words
+        self._lines += text.count('\n')
+        self._last_char = text[-1]
+        if self.text_widget is not None:
+            self.text_widget.configure(state=tk.NORMAL)
+            self.text_widget.insert(tk.END, text)
+            self.text_widget.configure(state=tk.DISABLED)
+            self._fit()
+        self._update_header()
+
+    def clear(self):
+        self._parts.clear()
+        self._words = 0
+        self._lines = 1
+        self._last_char = " "
+        if self.text_widget is not None:
+            self.text_widget.configure(state=tk.NORMAL)
+            self.text_widget.delete("1.0", tk.END)
+            self.text_widget.configure(state=tk.DISABLED)
+            self._fit()
+        self._update_header()
+
+    def set_thinking(self, thinking: bool):
+        self._thinking = thinking
+        self._update_header()
+
+    def toggle(self):
+        self._expanded = not self._expanded
+        if self._expanded:
+            if self.text_widget is None:
+                self.text_widget = tk.Text(
+                    self, wrap="word", font=("Segoe UI", 10), fg=self.theme["text_secondary"],
+                    bg=self.theme["bg_tertiary"], relief="flat", bd=0, padx=8, pady=6, cursor="arrow"
                 )
-                cell_label.pack(fill="both", expand=True)
+                self.text_widget.insert("1.0", "".join(self._parts))
+                self.text_widget.configure(state=tk.DISABLED)
+            self.text_widget.pack(fill="x", pady=(4, 0))
+            self._fit()
+        elif self.text_widget is not None:
+            self.text_widget.pack_forget()
+        self._update_header()
+
+    def _fit(self):
+        self.text_widget.configure(height=max(1, min(self._lines, self.MAX_LINES)))
+
+    def _update_header(self):
+        arrow = "▾" if self._expanded else "▸"
+        label = "Thinking…" if self._thinking else "Reasoning"
+        self.header.configure(text=f"{arrow} 💭 {label} ({self._words} words)")
 
 
 class MessageRenderer(tk.Frame):
     RENDER_THRESHOLD = 30
-    RERENDER_INTERVAL = 100  # Re-render every 100 tokens during streaming
+    ASYNC_PARSE_CHARS = 4000  # Longer texts are parsed off the Tk thread
+    # Set from settings.json by the App
+    PROGRESSIVE_CHARS = 20000  # Longer messages are drawn in time slices, top first
+    COLLAPSE_LINES = 300  # Code blocks and tables longer than this open collapsed
 
-    def __init__(self, master, theme: Dict, role: str):
+    def __init__(self, master, theme: Dict, role: str, pool: Optional[BlockWidgetPool] = None):
         bubble_bg = theme["user_bubble"] if role == "user" else theme["ai_bubble"]
         super().__init__(master, bg=bubble_bg)
         self.theme = theme
         self.role = role
         self.bubble_bg = bubble_bg
-        self._raw_content = ""
+        self._raw_parts: List[str] = []  # Raw text as appended; joined on demand
+        self._plan = EMPTY_PLAN  # What the widgets currently show
+        self._stream: Optional[StreamParser] = None  # Local parser when fed raw deltas
+        self._restart = False  # Next plan replaces the widgets instead of extending them
+        self._generation = 0  # Bumped per content change; stale async parses are dropped
         self._is_streaming = False
         self._token_count = 0
-        self._last_render_token_count = 0  # Track when we last rendered
-        self._last_rendered_content = ""
         self._formatted_mode = False
         self.content_frame = tk.Frame(self, bg=bubble_bg)
         self.content_frame.pack(fill="both", expand=True, padx=12, pady=10)
-        self._widgets = []
+        self.pool = pool or BlockWidgetPool(self.content_frame, theme)
+        self._views: List[_BlockView] = []
+        self._frozen_views = 0  # Leading views whose blocks are closed and fully shown
         self._plain_text_widget = None
+        self._reasoning: Optional[ReasoningSection] = None
+        self._collapse = False  # Showing a stored message: huge blocks get placeholders
+        self._render_job = None
 
-    def _create_text_widget(self, parent) -> tk.Text:
-        text = tk.Text(
-            parent, wrap=tk.WORD, relief=tk.FLAT, bd=0, bg=self.bubble_bg, fg=self.theme["text_primary"],
-            font=("Segoe UI", 11), cursor="arrow", padx=0, pady=0, highlightthickness=0, height=1
-        )
-        self._configure_tags(text)
-        return text
+    def _acquire(self, kind: str, language: str = "", **pack_options) -> tk.Widget:
+        widget = self.pool.acquire(kind, self.bubble_bg, language)
+        widget.pack(in_=self.content_frame, **pack_options)
+        return widget
 
-    def _configure_tags(self, text_widget: tk.Text):
-        theme = self.theme
-        text_widget.tag_configure("normal", font=("Segoe UI", 11))
-        text_widget.tag_configure("bold", font=("Segoe UI", 11, "bold"))
-        text_widget.tag_configure("italic", font=("Segoe UI", 11, "italic"))
-        text_widget.tag_configure("bold_italic", font=("Segoe UI", 11, "bold", "italic"))
-        text_widget.tag_configure("underline", font=("Segoe UI", 11, "underline"))
-        text_widget.tag_configure("strikethrough", font=("Segoe UI", 11, "overstrike"))
-        text_widget.tag_configure("inline_code", font=("Consolas", 10), background=theme["code_bg"])
-        for level in range(1, 7):
-            sizes = {1: 18, 2: 16, 3: 14, 4: 13, 5: 12, 6: 11}
-            text_widget.tag_configure(f"h{level}", font=("Segoe UI", sizes[level], "bold"), foreground=theme["accent_blue"])
-        text_widget.tag_configure("bullet", lmargin1=15, lmargin2=30)
-        text_widget.tag_configure("bullet1", lmargin1=35, lmargin2=50)
-        text_widget.tag_configure("bullet2", lmargin1=55, lmargin2=70)
-        text_widget.tag_configure("numbered", lmargin1=15, lmargin2=30)
+    def _acquire_text(self) -> tk.Text:
+        return self._acquire("text", fill="x", expand=True)
 
     def _clear_widgets(self):
-        for w in self._widgets:
+        if self._render_job is not None:
+            self.after_cancel(self._render_job)
+            self._render_job = None
+        for view in self._views:
+            try:
+                self.pool.release(view.widget)
+            except:
+                pass
+        self._views.clear()
+        self._frozen_views = 0
+        self._release_plain_text()
+
+    def _release_plain_text(self):
+        if self._plain_text_widget is not None:
             try:
-                w.destroy()
+                self.pool.release(self._plain_text_widget)
             except:
                 pass
-        self._widgets.clear()
         self._plain_text_widget = None
 
+    def destroy(self):
+        # Pooled widgets belong to the pool's host, so hand them back rather than lose them
+        self._clear_widgets()
+        super().destroy()
+
+    def _reset(self):
+        self._clear_widgets()
+        self._plan = EMPTY_PLAN
+
+    def _append_reasoning(self, reasoning: str):
+        if self._reasoning is None:
+            self._reasoning = ReasoningSection(self, self.theme, self.bubble_bg)
+            self._reasoning.pack(fill="x", padx=12, pady=(8, 0), before=self.content_frame)
+            self._reasoning.set_thinking(self._is_streaming)
+        self._reasoning.append(reasoning)
+
+    def _set_reasoning(self, reasoning: str):
+        if reasoning:
+            if self._reasoning is not None:
+                self._reasoning.clear()
+            self._append_reasoning(reasoning)
+        else:
+            self._drop_reasoning()
+
+    def _drop_reasoning(self):
+        if self._reasoning is not None:
+            self._reasoning.destroy()
+            self._reasoning = None
+
     def _auto_height(self, text_widget: tk.Text):
-        text_widget.update_idletasks()
-        content = text_widget.get("1.0", "end-1c")
-        line_count = content.count('\n') + 1
-        text_widget.configure(height=max(1, line_count))
+        fit_text_height(text_widget)
 
     def set_streaming(self, streaming: bool):
         was_streaming = self._is_streaming
         self._is_streaming = streaming
-        if was_streaming and not streaming:
+        if streaming and not was_streaming:
+            # Plans from a new stream start over; the old widgets stay until the first one lands
+            self._generation += 1
+            self._stream = None
+            self._restart = True
+            if self._reasoning is not None:
+                self._reasoning.set_thinking(True)
+        elif was_streaming and not streaming:
             # Final render when streaming ends
             self._token_count = 0
-            self._last_render_token_count = 0
-            self._render_formatted(self._raw_content)
-            self._formatted_mode = True
+            if self._stream is not None:
+                cleaned, reasoning, plan = self._stream.finish()
+                self._stream = None
+                self._apply(cleaned, reasoning, plan)
+            elif not self._plan.finished or self._restart:
+                # Stopped before the final plan arrived: settle on what was received
+                self._restart = True
+                self._apply("", "", parse_markdown(self.get_raw_content()))
+            if self._reasoning is not None:
+                if self._reasoning.has_text:
+                    self._reasoning.set_thinking(False)
+                else:
+                    self._drop_reasoning()
+            if self._plan.finished:
+                # Hand the finished parse to the cache so copy/reload never re-parse it
+                MARKDOWN_CACHE.put(self.get_raw_content(), self._plan)
+            if not self._formatted_mode:
+                self._release_plain_text()
+                self._formatted_mode = True
+                self._sync_views()
 
     def update_content(self, content: str):
-        if content == self._raw_content:
+        raw = self.get_raw_content()
+        if content == raw:
             return
-        old_len = len(self._raw_content)
-        self._raw_content = content
+        if self._is_streaming and content.startswith(raw):
+            self.append_content(content[len(raw):])
+            return
+        self._raw_parts = [content]
+        self._generation += 1
         if self._is_streaming:
-            new_tokens = len(content) - old_len
-            self._token_count += max(1, new_tokens // 4)
-            
-            # Check if we should switch to formatted mode
-            if not self._formatted_mode and self._token_count >= self.RENDER_THRESHOLD:
-                if has_markdown_formatting(content):
-                    self._formatted_mode = True
-                    self._render_formatted(content)
-                    self._last_rendered_content = content
-                    self._last_render_token_count = self._token_count
-                else:
-                    self._update_plain_text(content)
-            elif self._formatted_mode:
-                # Check if it's time to re-render (every RERENDER_INTERVAL tokens)
-                tokens_since_last_render = self._token_count - self._last_render_token_count
-                if tokens_since_last_render >= self.RERENDER_INTERVAL:
-                    self._render_formatted(content)
-                    self._last_rendered_content = content
-                    self._last_render_token_count = self._token_count
-                else:
-                    # Incremental update between full re-renders
-                    self._incremental_update(content)
-            else:
-                self._update_plain_text(content)
-        else:
-            # Not streaming - always render formatted
-            self._render_formatted(content)
-            self._formatted_mode = True
+            # Rewritten rather than extended: start the stream over
+            self._stream = None
+            self._restart = True
+            self.append_content("")
+            return
+        # Not streaming - always render formatted, from the shared parse cache
+        self._formatted_mode = True
+        doc = MARKDOWN_CACHE.get(content)
+        if doc is None and len(content) >= self.ASYNC_PARSE_CHARS:
+            # Don't leave the previous message (or its progressive render) on show meanwhile
+            self._reset()
+            self._drop_reasoning()
+            generation = self._generation
+            PARSE_WORKER.submit(
+                content, lambda plan: self._post(lambda: self._on_parsed(generation, plan)),
+                lambda: self._generation == generation
+            )
+            return
+        self._render_document(doc or parse_markdown(content))
+
+    def _post(self, callback: Callable):
+        try:
+            self.after(0, callback)
+        except:
+            pass  # Renderer destroyed while the parse ran
+
+    def _on_parsed(self, generation: int, plan: RenderPlan):
+        if generation == self._generation and not self._is_streaming and self.winfo_exists():
+            self._render_document(plan)
 
-    def _incremental_update(self, content: str):
-        new_content = content[len(self._last_rendered_content):]
-        if not new_content:
+    def append_content(self, delta: str):
+        """Raw text appended on the Tk thread; parsed here with a local StreamParser."""
+        if not self._is_streaming:
+            if delta:
+                self.update_content(self.get_raw_content() + delta)
             return
-        has_special = bool(re.search(r'```|\n#{1,6}\s|\n\s*[-*+]\s|\n\s*\d+\.\s|\n\|', new_content))
-        if has_special:
-            self._render_formatted(content)
-            self._last_rendered_content = content
-            self._last_render_token_count = self._token_count
+        if self._stream is None:
+            # First local delta of this stream: parse what was already there too
+            self._stream = StreamParser()
+            delta = self.get_raw_content() + delta
+            self._raw_parts = [delta]
+        elif delta:
+            self._raw_parts.append(delta)
+        self._token_count += max(1, len(delta) // 4)
+        self._apply(*self._stream.feed(delta))
+
+    def apply_stream(self, raw: str, cleaned: str, reasoning: str, plan: RenderPlan):
+        """Streaming fast path for text parsed off the Tk thread: ``raw``,
+        ``cleaned`` and ``reasoning`` are what arrived since the last call,
+        ``plan`` the newest parse (older ones are simply never applied)."""
+        if raw:
+            self._raw_parts.append(raw)
+            self._token_count += max(1, len(raw) // 4)
+        self._apply(cleaned, reasoning, plan)
+
+    def _apply(self, cleaned: str, reasoning: str, plan: RenderPlan):
+        if self._restart:
+            self._restart = False
+            self._clear_widgets()
+            self._plan = EMPTY_PLAN
+            self._collapse = False
+            if self._reasoning is not None:
+                self._reasoning.clear()  # Kept, so an opened section stays open
+            if plan.finished:
+                reasoning = plan.reasoning
+        if reasoning:
+            self._append_reasoning(reasoning)
+        if plan.generation and plan.generation <= self._plan.generation:
             return
-        if self._widgets and isinstance(self._widgets[-1], tk.Text):
-            last_text = self._widgets[-1]
-            last_text.configure(state=tk.NORMAL)
-            last_text.insert(tk.END, new_content, ("normal",))
-            last_text.configure(state=tk.DISABLED)
-            self._auto_height(last_text)
-            self._last_rendered_content = content
+        self._plan = plan
+        if self._formatted_mode:
+            self._sync_views()
+        elif self._token_count >= self.RENDER_THRESHOLD and plan.has_formatting:
+            # Switch to formatted mode once; the text is already parsed
+            self._formatted_mode = True
+            self._release_plain_text()
+            self._sync_views()
+        elif cleaned:
+            self._append_plain_text(cleaned)
+
+    def _render_document(self, doc: RenderPlan):
+        self._clear_widgets()
+        self._plan = doc
+        self._collapse = True
+        self._set_reasoning(doc.reasoning)
+        if len(doc.text) >= self.PROGRESSIVE_CHARS:
+            self._render_slice()
         else:
-            self._render_formatted(content)
-            self._last_rendered_content = content
-            self._last_render_token_count = self._token_count
+            self._sync_views()
 
-    def _update_plain_text(self, text: str):
-        cleaned = strip_markdown(text)
+    def _render_slice(self):
+        """Draw the next frame's worth of a long document, then yield to Tk."""
+        self._render_job = None
+        if not self._sync_views(time.perf_counter() + UI_FRAME_MS / 1000):
+            self._render_job = self.after(1, self._render_slice)
+
+    def _append_plain_text(self, cleaned: str):
         if self._plain_text_widget is None:
-            self._clear_widgets()
-            self._plain_text_widget = self._create_text_widget(self.content_frame)
-            self._plain_text_widget.pack(fill="x", expand=True)
-            self._widgets.append(self._plain_text_widget)
+            self._plain_text_widget = self._acquire_text()
         self._plain_text_widget.configure(state=tk.NORMAL)
-        self._plain_text_widget.delete("1.0", tk.END)
-        self._plain_text_widget.insert("1.0", cleaned, ("normal",))
+        self._plain_text_widget.insert(tk.END, cleaned, ("normal",))
         self._plain_text_widget.configure(state=tk.DISABLED)
         self._auto_height(self._plain_text_widget)
 
-    def _render_formatted(self, text: str):
-        self._clear_widgets()
-        cleaned = MarkdownParser.clean_text(text)
-        if not cleaned:
-            return
-        lines = cleaned.split('\n')
-        i = 0
-        current_text = None
-        while i < len(lines):
-            line = lines[i]
-            if line.strip().startswith('```'):
-                if current_text:
-                    current_text.configure(state=tk.DISABLED)
-                    self._auto_height(current_text)
-                    current_text = None
-                lang = line.strip()[3:].strip()
-                code_lines = []
-                i += 1
-                while i < len(lines) and not lines[i].strip().startswith('```'):
-                    code_lines.append(lines[i])
-                    i += 1
-                code_content = '\n'.join(code_lines)
-                code_widget = CodeBlockWidget(self.content_frame, self.theme, code_content, lang)
-                code_widget.pack(fill="x", pady=4)
-                self._widgets.append(code_widget)
-                i += 1
-                continue
-            if line.strip().startswith('|') and line.strip().endswith('|'):
-                if current_text:
-                    current_text.configure(state=tk.DISABLED)
-                    self._auto_height(current_text)
-                    current_text = None
-                table_lines = []
-                while i < len(lines) and lines[i].strip().startswith('|'):
-                    table_lines.append(lines[i])
-                    i += 1
-                rows = MarkdownParser.parse_table_rows(table_lines)
-                if rows:
-                    table_widget = TableWidget(self.content_frame, self.theme, rows)
-                    table_widget.pack(fill="x", pady=4)
-                    self._widgets.append(table_widget)
-                continue
-            if current_text is None:
-                current_text = self._create_text_widget(self.content_frame)
-                current_text.pack(fill="x", expand=True)
-                self._widgets.append(current_text)
-                current_text.configure(state=tk.NORMAL)
+    def _sync_views(self, deadline: Optional[float] = None) -> bool:
+        """Bring the widgets up to the plan. With a ``deadline`` (perf_counter
+        seconds) it stops once that has passed and returns False; the next
+        call carries on where it stopped."""
+        plan = self._plan
+        blocks = plan.blocks
+        for idx in range(self._frozen_views, len(blocks)):
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            block = blocks[idx]
+            if idx < len(self._views):
+                view = self._views[idx]
+                if view.block is None and block.kind != "text":
+                    # Provisional tail view whose line turned into another kind of block
+                    self.pool.release(view.widget)
+                    view = self._views[idx] = self._create_view(block)
+                view.block = block  # Newest snapshot of the block
             else:
-                current_text.insert(tk.END, "\n")
-            header_match = re.match(r'^(#{1,6})\s+(.+)$', line)
-            if header_match:
-                level = len(header_match.group(1))
-                InlineFormatter.render_line(current_text, header_match.group(2), (f"h{level}",))
-                i += 1
-                continue
-            bullet_match = re.match(r'^(\s*)([-*+])\s+(.+)$', line)
-            if bullet_match:
-                indent_level = len(bullet_match.group(1)) // 2
-                tag = "bullet" if indent_level == 0 else f"bullet{min(indent_level, 2)}"
-                bullets = ["•", "◦", "▪"]
-                bullet_char = bullets[min(indent_level, 2)]
-                current_text.insert(tk.END, f"{bullet_char} ", (tag,))
-                InlineFormatter.render_line(current_text, bullet_match.group(3), (tag,))
-                i += 1
-                continue
-            num_match = re.match(r'^(\s*)(\d+\.)\s+(.+)$', line)
-            if num_match:
-                current_text.insert(tk.END, f"{num_match.group(2)} ", ("numbered",))
-                InlineFormatter.render_line(current_text, num_match.group(3), ("numbered",))
-                i += 1
-                continue
-            if line.strip():
-                InlineFormatter.render_line(current_text, line)
-            i += 1
-        if current_text:
-            current_text.configure(state=tk.DISABLED)
-            self._auto_height(current_text)
-        self._plain_text_widget = None
+                view = self._create_view(block)
+                self._views.append(view)
+            if not self._patch_view(view, deadline):
+                return False
+            if block.closed and idx == self._frozen_views:
+                self._frozen_views += 1
+        # A provisional view that no block claimed
+        if len(self._views) > len(blocks) and plan.tail_kind != "text":
+            self.pool.release(self._views.pop().widget)
+        self._render_tail()
+        return True
+
+    def _create_view(self, block: Optional[BlockPlan]) -> _BlockView:
+        if (self._collapse and block is not None and block.kind in ("code", "table")
+                and len(block.lines) > self.COLLAPSE_LINES):
+            placeholder = self._acquire("collapsed", fill="x", pady=4)
+            view = _BlockView(block, placeholder, collapsed=True)
+            if block.kind == "code":
+                label = f"▸ {block.lang or 'code'} · {len(block.lines):,} lines (click to show)"
+            else:
+                label = f"▸ Table · {len(block.rows):,} rows (click to show)"
+            placeholder.configure(text=label, command=lambda: self._expand_view(view))
+            return view
+        if block is not None and block.kind == "code":
+            return _BlockView(block, self._acquire("code", block.lang, fill="x", pady=4))
+        if block is not None and block.kind == "table":
+            return _BlockView(block, self._acquire("table", fill="x", pady=4))
+        return _BlockView(block, self._acquire_text())
+
+    def _expand_view(self, view: _BlockView):
+        """Swap a collapsed placeholder for the real block widget, in place."""
+        if not view.collapsed or view not in self._views:
+            return
+        placeholder = view.widget
+        view.widget = self._acquire(view.block.kind, view.block.lang, fill="x", pady=4, after=placeholder)
+        self.pool.release(placeholder)
+        view.collapsed = False
+        view.lines = 0
+        self._patch_view(view)
+
+    def _patch_view(self, view: _BlockView, deadline: Optional[float] = None) -> bool:
+        """Show the lines of the view's block that are not on screen yet; False
+        if the deadline cut it short."""
+        block = view.block
+        if view.collapsed or (view.lines == len(block.lines) and not view.tail):
+            view.lines = len(block.lines)
+            return True
+        new_lines = block.lines[view.lines:]
+        if block.kind == "code":
+            if new_lines:
+                view.widget.append_lines(new_lines)
+            elif view.tail:
+                view.widget.set_tail("")
+        elif block.kind == "table":
+            if new_lines:
+                view.widget.set_rows(block.rows)
+        else:
+            text = view.widget
+            text.configure(state=tk.NORMAL)
+            text.delete("tail", "end")
+            for node in block.nodes[view.lines:]:
+                self._insert_text_line(text, node, view.lines == 0)
+                view.lines += 1
+                if deadline is not None and not view.lines % 64 and time.perf_counter() > deadline:
+                    break
+            text.mark_set("tail", "end-1c")
+            text.configure(state=tk.DISABLED)
+            self._auto_height(text)
+            if view.lines < len(block.lines):
+                return False
+        view.lines = len(block.lines)
+        view.tail = False
+        return True
+
+    def _render_tail(self):
+        plan = self._plan
+        kind = plan.tail_kind
+        if kind is None:
+            if self._views and self._views[-1].tail:
+                self._clear_tail(self._views[-1])
+            return
+        if kind == "code":
+            view = self._views[-1]
+            view.widget.set_tail(plan.tail)
+            view.tail = True
+            return
+        open_block = plan.open_block
+        if open_block is not None and open_block.kind == "text":
+            view = self._views[-1]
+        elif len(self._views) > len(plan.blocks):
+            view = self._views[-1]  # Provisional view kept from the last update
+        else:
+            view = self._create_view(None)
+            self._views.append(view)
+        text = view.widget
+        text.configure(state=tk.NORMAL)
+        text.delete("tail", "end")
+        self._insert_text_line(text, plan.tail_node, view.lines == 0)
+        text.configure(state=tk.DISABLED)
+        self._auto_height(text)
+        view.tail = True
+
+    def _clear_tail(self, view: _BlockView):
+        if isinstance(view.widget, CodeBlockWidget):
+            view.widget.set_tail("")
+        elif isinstance(view.widget, tk.Text):
+            view.widget.configure(state=tk.NORMAL)
+            view.widget.delete("tail", "end")
+            view.widget.configure(state=tk.DISABLED)
+            self._auto_height(view.widget)
+        view.tail = False
+
+    def _insert_text_line(self, text_widget: tk.Text, node: MarkdownLine, first: bool):
+        if not first:
+            text_widget.insert(tk.END, "\n")
+        base_tags = ()
+        if node.kind == "header":
+            base_tags = (f"h{node.level}",)
+        elif node.kind == "bullet":
+            tag = "bullet" if node.level == 0 else f"bullet{min(node.level, 2)}"
+            bullets = ["•", "◦", "▪"]
+            text_widget.insert(tk.END, f"{bullets[min(node.level, 2)]} ", (tag,))
+            base_tags = (tag,)
+        elif node.kind == "numbered":
+            text_widget.insert(tk.END, f"{node.marker} ", ("numbered",))
+            base_tags = ("numbered",)
+        InlineFormatter.insert_segments(text_widget, node.segments, base_tags)
 
     def get_raw_content(self) -> str:
-        return self._raw_content
+        if len(self._raw_parts) > 1:
+            self._raw_parts = ["".join(self._raw_parts)]
+        return self._raw_parts[0] if self._raw_parts else ""
 
     def get_plain_text(self) -> str:
-        return MarkdownParser.clean_text(self._raw_content)
+        return parse_markdown(self.get_raw_content()).text
+
+
+def atomic_write_json(path: str, data, **dump_kwargs):
+    """Write JSON next to its destination, fsync it and rename it into place, so
+    a crash mid-write leaves either the old file or the new one, never half."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PersistenceWriter:
+    """Single background thread that owns all session I/O. Records queued within
+    FLUSH_DELAY of each other are handed to the store as one batch."""
+    FLUSH_DELAY = 0.5
+
+    def __init__(self, sink: Callable[[List[Dict]], None]):
+        self._sink = sink
+        self._cond = threading.Condition()
+        self._pending: List[Dict] = []
+        self._busy = False
+        self._flush_requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="session-writer")
+        self._thread.start()
+
+    def submit(self, record: Dict):
+        with self._cond:
+            self._pending.append(record)
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything submitted so far has been written."""
+        with self._cond:
+            if self._pending:
+                # Only cut the debounce short for records that are waiting; a
+                # flag left set with nothing queued would skip the next one's
+                self._flush_requested = True
+                self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self):
+        self.flush(timeout=10)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if self._closed and not self._pending:
+                    return
+                # Debounce: let a burst of mutations land in the same batch
+                deadline = time.monotonic() + self.FLUSH_DELAY
+                while not (self._flush_requested or self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                self._busy = True
+                self._flush_requested = False
+            try:
+                self._sink(batch)
+            except Exception as e:
+                print(f"Session write error: {e}")
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without the model's tokenizer: about four characters
+    or three quarters of a word per token, whichever gives more."""
+    if not text:
+        return 0
+    return max(len(text) // 4, len(text.split()) * 4 // 3) + 1
+
+
+MESSAGE_TOKEN_OVERHEAD = 4  # Role markers the chat template wraps around each message
+
+
+def apply_session_record(sessions: Dict[str, Dict], record: Dict):
+    """Apply one journal record to an in-memory sessions dict. Records are
+    idempotent so a replay over a snapshot that already contains them is
+    harmless. Sessions whose messages are not loaded only get metadata."""
+    op = record.get("op")
+    sid = record.get("session_id")
+    if op == "create_session":
+        sessions[sid] = record["session"]
+    elif op == "delete_session":
+        sessions.pop(sid, None)
+    elif sid in sessions:
+        session = sessions[sid]
+        msgs = session.get("messages")
+        if msgs is not None:
+            if op == "add_message":
+                msg = record["message"]
+                if not any(m.get("id") == msg["id"] for m in msgs):
+                    msgs.append(msg)
+            elif op == "delete_message":
+                session["messages"] = [m for m in msgs if m.get("id") != record["message_id"]]
+            elif op == "update_message":
+                msg = record["message"]
+                session["messages"] = [msg if m.get("id") == msg["id"] else m for m in msgs]
+        if "title" in record:
+            session["title"] = record["title"]
+        if "options" in record:
+            session["options"] = record["options"]
+        if "model" in record:
+            session["model"] = record["model"]
+        if "updated_at" in record:
+            session["updated_at"] = record["updated_at"]
+
+
+class JournalSessionStore:
+    """sessions.json snapshot plus an append-only journal of mutations."""
+    lazy = False
+    JOURNAL_COMPACT_THRESHOLD = 500  # Journal records before the snapshot is rewritten
+
+    def __init__(self, snapshot_file: str = SESSIONS_FILE, journal_file: str = SESSIONS_JOURNAL_FILE):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self._sessions: Dict[str, Dict] = {}
+        self._journal_records = 0
+        self.snapshot_source: Callable[[], Dict[str, Dict]] = lambda: self._sessions
+
+    def load(self) -> Dict[str, Dict]:
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    self._sessions = json.load(f)
+            except:
+                self._sessions = {}
+        self._replay_journal()
+        # Older snapshots have no message ids; journal records address messages by id
+        needs_ids = False
+        for session in self._sessions.values():
+            for msg in session.get("messages", []):
+                if "id" not in msg:
+                    msg["id"] = str(uuid.uuid4())
+                    needs_ids = True
+        if needs_ids or self._journal_records >= self.JOURNAL_COMPACT_THRESHOLD:
+            self.compact()
+        return self._sessions
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        good_end = 0
+        torn = unterminated = False
+        try:
+            with open(self.journal_file, 'rb') as f:
+                for raw in f:
+                    line = raw.strip()
+                    if line:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            torn = True  # Crash mid-append
+                            break
+                        apply_session_record(self._sessions, record)
+                        self._journal_records += 1
+                    good_end += len(raw)
+                    unterminated = not raw.endswith(b"\n")
+            if torn or unterminated:
+                # Later appends must start on a fresh line after the last good
+                # record, or the next replay would stop at the fragment again
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(good_end)
+                    if unterminated:
+                        f.seek(good_end)
+                        f.write(b"\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError as e:
+            print(f"Session journal error: {e}")
+
+    def load_messages(self, session_id: str) -> List[Dict]:
+        return self._sessions.get(session_id, {}).get("messages", [])
+
+    def append_many(self, records: List[Dict]):
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_records += len(records)
+        except OSError as e:
+            print(f"Session journal error: {e}")
+        if self._journal_records >= self.JOURNAL_COMPACT_THRESHOLD:
+            self.compact()
+
+    def _save_snapshot(self) -> bool:
+        try:
+            atomic_write_json(self.snapshot_file, self.snapshot_source(), ensure_ascii=False, indent=2)
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Session snapshot error: {e}")
+            return False
 
+    def compact(self):
+        """Fold the journal into a fresh snapshot and start an empty journal."""
+        if self._save_snapshot():
+            try:
+                if os.path.exists(self.journal_file):
+                    os.remove(self.journal_file)
+                self._journal_records = 0
+            except OSError:
+                pass
 
-class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[str, Dict] = {}
-        self.current_session_id: Optional[str] = None
-        self._load_sessions()
+    def close(self):
+        if self._journal_records:
+            self.compact()
+
+
+class SqliteSessionStore:
+    """Sessions and messages in indexed SQLite tables. Only session metadata is
+    read at startup; messages are fetched when a chat is opened."""
+    lazy = True
+    MESSAGE_COLUMNS = ("id", "role", "content", "timestamp")
+
+    def __init__(self, db_file: str = SESSIONS_DB_FILE):
+        self.db_file = db_file
+        # Written from the persistence thread, read from the UI thread when a chat opens
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY, title TEXT, created_at TEXT, updated_at TEXT, model TEXT, options TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at);
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY, session_id TEXT NOT NULL, seq INTEGER NOT NULL,
+                role TEXT, content TEXT, timestamp TEXT, extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, seq);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        if "options" not in {row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")}:
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN options TEXT")
+        self._migrate_from_json()
+
+    def _migrate_from_json(self):
+        """One-time import of sessions.json (and its journal) into the database."""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        if os.path.exists(SESSIONS_FILE) or os.path.exists(SESSIONS_JOURNAL_FILE):
+            sessions = JournalSessionStore().load()
+            with self.conn:
+                for sid, data in sessions.items():
+                    self._insert_session(sid, data)
+                    for msg in data.get("messages", []):
+                        self._insert_message(sid, msg)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                              (datetime.now().isoformat(),))
+
+    def _insert_session(self, sid: str, data: Dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, title, created_at, updated_at, model, options) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (sid, data.get("title", "New Chat"), data.get("created_at"), data.get("updated_at"), data.get("model"),
+             json.dumps(data["options"]) if data.get("options") else None)
+        )
 
-    def _load_sessions(self):
-        if os.path.exists(SESSIONS_FILE):
-            try:
-                with open(SESSIONS_FILE, 'r', encoding='utf-8') as f:
-                    self.sessions = json.load(f)
-            except:
-                self.sessions = {}
+    def _insert_message(self, sid: str, msg: Dict):
+        extra = {k: v for k, v in msg.items() if k not in self.MESSAGE_COLUMNS}
+        self.conn.execute(
+            "INSERT OR IGNORE INTO messages (id, session_id, seq, role, content, timestamp, extra) "
+            "VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE session_id = ?), ?, ?, ?, ?)",
+            (msg.get("id") or str(uuid.uuid4()), sid, sid, msg.get("role"), msg.get("content"),
+             msg.get("timestamp"), json.dumps(extra, ensure_ascii=False) if extra else None)
+        )
 
-    def _save_sessions(self):
+    def load(self) -> Dict[str, Dict]:
+        sessions = {}
+        for sid, title, created_at, updated_at, model, options in self.conn.execute(
+                "SELECT id, title, created_at, updated_at, model, options FROM sessions"):
+            sessions[sid] = {
+                "title": title, "created_at": created_at, "updated_at": updated_at,
+                "messages": None, "model": model, "options": json.loads(options) if options else {}
+            }
+        return sessions
+
+    def load_messages(self, session_id: str) -> List[Dict]:
+        messages = []
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, role, content, timestamp, extra FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,)).fetchall()
+        for mid, role, content, timestamp, extra in rows:
+            msg = {"id": mid, "role": role, "content": content, "timestamp": timestamp}
+            if extra:
+                msg.update(json.loads(extra))
+            messages.append(msg)
+        return messages
+
+    def append_many(self, records: List[Dict]):
+        try:
+            with self.lock, self.conn:
+                for record in records:
+                    self._apply(record)
+        except sqlite3.Error as e:
+            print(f"Session store error: {e}")
+
+    def _apply(self, record: Dict):
+        op = record.get("op")
+        sid = record.get("session_id")
+        if op == "create_session":
+            self._insert_session(sid, record["session"])
+        elif op == "delete_session":
+            self.conn.execute("DELETE FROM messages WHERE session_id = ?", (sid,))
+            self.conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        elif op == "add_message":
+            self._insert_message(sid, record["message"])
+        elif op == "delete_message":
+            self.conn.execute("DELETE FROM messages WHERE id = ?", (record["message_id"],))
+        elif op == "update_message":
+            msg = record["message"]
+            extra = {k: v for k, v in msg.items() if k not in self.MESSAGE_COLUMNS}
+            self.conn.execute(
+                "UPDATE messages SET content = ?, extra = ? WHERE id = ?",
+                (msg.get("content"), json.dumps(extra, ensure_ascii=False) if extra else None, msg["id"])
+            )
+        for column in ("title", "updated_at", "model"):
+            if column in record:
+                self.conn.execute(f"UPDATE sessions SET {column} = ? WHERE id = ?", (record[column], sid))
+        if "options" in record:
+            self.conn.execute("UPDATE sessions SET options = ? WHERE id = ?",
+                              (json.dumps(record["options"]) if record["options"] else None, sid))
+
+    def close(self):
         try:
-            with open(SESSIONS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.sessions, f, ensure_ascii=False, indent=2)
+            self.conn.close()
         except:
             pass
 
+
+class SessionManager:
+    HISTORY_POLICIES = ("recent", "first_and_recent", "all")
+
+    def __init__(self, backend: str = "json", store=None):
+        self.store = store or (SqliteSessionStore() if backend == "sqlite" else JournalSessionStore())
+        self.sessions: Dict[str, Dict] = self.store.load()
+        self.current_session_id: Optional[str] = None
+        # Guards self.sessions: the UI thread and stream workers both mutate it
+        self.lock = threading.RLock()
+        self.store.snapshot_source = self.snapshot
+        self.writer = PersistenceWriter(self.store.append_many)
+        # Per chat, counts for messages saved before counts were stored with them
+        self._token_counts: Dict[str, Dict[str, int]] = {}
+        self._closed = False
+        atexit.register(self.close)
+
+    def _commit(self, record: Dict):
+        # The writer serializes up to FLUSH_DELAY later, and applying the record
+        # may install its dicts as live session state: it gets its own copy
+        queued = copy.deepcopy(record)
+        with self.lock:
+            apply_session_record(self.sessions, record)
+            # Queued under the lock so a lazy load can't fall between apply and submit
+            self.writer.submit(queued)
+
+    def _messages(self, session_id: str) -> List[Dict]:
+        with self.lock:
+            session = self.sessions[session_id]
+            if session["messages"] is None:
+                # Records for this chat may still be queued for the store. Holding
+                # the lock keeps new ones from being skipped in memory (the chat is
+                # unloaded) yet landing after the load. Only the SQLite store loads
+                # lazily, and its writes never take this lock.
+                self.writer.flush()
+                session["messages"] = self.store.load_messages(session_id)
+            return session["messages"]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Consistent copy for the writer thread. Message dicts are never mutated
+        in place, so copying the lists is enough."""
+        with self.lock:
+            return {
+                sid: {**data, "messages": list(data["messages"]) if data["messages"] is not None else None}
+                for sid, data in self.sessions.items()
+            }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.writer.close()
+        self.store.close()
+
+    def list_sessions(self) -> List[tuple]:
+        """(session_id, title, updated_at) newest first, without touching messages."""
+        return sorted(
+            ((sid, data["title"], data.get("updated_at") or data.get("created_at") or "")
+             for sid, data in self.sessions.items()),
+            key=lambda x: x[2], reverse=True
+        )
+
+    def open_session(self, session_id: str):
+        self.current_session_id = session_id
+        self._messages(session_id)
+        # Counts are cheap to redo; keep only the open chat's
+        self._token_counts = {session_id: self._token_counts.get(session_id, {})}
+        if self.store.lazy:
+            # Keep resident memory flat: only the open chat holds its messages
+            with self.lock:
+                for sid, data in self.sessions.items():
+                    if sid != session_id:
+                        data["messages"] = None
+
     def create_new_session(self) -> str:
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            "title": "New Chat",
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat(),
-            "messages": [],
-            "model": None
-        }
-        self.current_session_id = session_id
-        self._save_sessions()
+        self._commit({
+            "op": "create_session", "session_id": session_id,
+            "session": {
+                "title": "New Chat",
+                "created_at": datetime.now().isoformat(),
+                "updated_at": datetime.now().isoformat(),
+                "messages": [],
+                "model": None
+            }
+        })
+        self.open_session(session_id)
         return session_id
 
-    def add_message(self, role: str, content: str):
+    def add_message(self, role: str, content: str, session_id: Optional[str] = None,
+                    message_id: Optional[str] = None, incomplete: bool = False):
+        if session_id is None:
+            if not self.current_session_id or self.current_session_id not in self.sessions:
+                self.create_new_session()
+            session_id = self.current_session_id
+        elif session_id not in self.sessions:
+            return
+        message = {
+            "id": message_id or str(uuid.uuid4()), "role": role, "content": content,
+            "timestamp": datetime.now().isoformat(), "tokens": estimate_tokens(content)
+        }
+        if incomplete:
+            message["incomplete"] = True
+        record = {
+            "op": "add_message", "session_id": session_id, "message": message,
+            "updated_at": datetime.now().isoformat()
+        }
+        if role == "user" and not self._messages(session_id):
+            record["title"] = content[:40].strip() + ("..." if len(content) > 40 else "")
+        self._commit(record)
+
+    def update_message(self, session_id: str, message_id: str, content: str, incomplete: bool = False):
+        if session_id not in self.sessions:
+            return
+        for msg in self._messages(session_id):
+            if msg.get("id") == message_id:
+                updated = {k: v for k, v in msg.items() if k != "incomplete"}
+                updated["content"] = content
+                updated["tokens"] = estimate_tokens(content)
+                if incomplete:
+                    updated["incomplete"] = True
+                self._commit({
+                    "op": "update_message", "session_id": session_id, "message": updated,
+                    "updated_at": datetime.now().isoformat()
+                })
+                return
+
+    def get_session_options(self, session_id: Optional[str] = None) -> Dict:
+        """Per-chat request options, e.g. {"think": False}; empty means server defaults."""
+        session = self.sessions.get(session_id or self.current_session_id)
+        return dict(session.get("options") or {}) if session else {}
+
+    def set_session_option(self, key: str, value):
+        """Set (or, with None, clear) an option of the current chat, creating one if needed."""
         if not self.current_session_id or self.current_session_id not in self.sessions:
             self.create_new_session()
-        session = self.sessions[self.current_session_id]
-        session["messages"].append({
-            "role": role, "content": content, "timestamp": datetime.now().isoformat()
-        })
-        session["updated_at"] = datetime.now().isoformat()
-        if role == "user" and len(session["messages"]) == 1:
-            session["title"] = content[:40].strip() + ("..." if len(content) > 40 else "")
-        self._save_sessions()
+        options = self.get_session_options()
+        if value is None:
+            options.pop(key, None)
+        else:
+            options[key] = value
+        self._commit({"op": "set_options", "session_id": self.current_session_id, "options": options})
+
+    def get_session_model(self, session_id: Optional[str] = None) -> Optional[str]:
+        session = self.sessions.get(session_id or self.current_session_id)
+        return session.get("model") if session else None
+
+    def pin_session(self, model: str, sampling: Dict, session_id: Optional[str] = None):
+        """Remember the model and sampling settings a chat last generated with."""
+        session_id = session_id or self.current_session_id
+        if session_id not in self.sessions:
+            return
+        options = self.get_session_options(session_id)
+        if self.get_session_model(session_id) == model and options.get("sampling") == sampling:
+            return
+        options["sampling"] = sampling
+        self._commit({"op": "set_options", "session_id": session_id, "model": model, "options": options})
+
+    def has_message(self, session_id: str, message_id: str) -> bool:
+        if session_id not in self.sessions:
+            return False
+        return any(m.get("id") == message_id for m in self._messages(session_id))
 
     def delete_message(self, index: int):
         if self.current_session_id in self.sessions:
-            msgs = self.sessions[self.current_session_id]["messages"]
+            msgs = self._messages(self.current_session_id)
             if 0 <= index < len(msgs):
-                msgs.pop(index)
-                self._save_sessions()
-
-    def get_conversation_history(self, system_prompt: str) -> List[Dict]:
-        if not self.current_session_id:
-            return [{"role": "system", "content": system_prompt}]
+                self._commit({
+                    "op": "delete_message", "session_id": self.current_session_id,
+                    "message_id": msgs[index]["id"]
+                })
+
+    def message_tokens(self, msg: Dict, session_id: Optional[str] = None) -> int:
+        tokens = msg.get("tokens")
+        if tokens is None:
+            # Message dicts are shared with the writer thread, so older ones are counted on the side
+            counts = self._token_counts.setdefault(session_id or self.current_session_id, {})
+            tokens = counts.get(msg["id"])
+            if tokens is None:
+                tokens = counts[msg["id"]] = estimate_tokens(msg["content"])
+        return tokens + MESSAGE_TOKEN_OVERHEAD
+
+    def plan_history(self, system_prompt: str, budget: Optional[int] = None, policy: str = "recent",
+                     session_id: Optional[str] = None) -> Tuple[List[Dict], int, int]:
+        """Fit a chat (the open one by default) into ``budget`` tokens. The system
+        prompt and the newest message always go; "recent" adds turns newest first
+        until the budget is spent, "first_and_recent" also keeps the opening
+        message, "all" sends everything. Returns (history, estimated tokens,
+        messages left out)."""
+        if policy not in self.HISTORY_POLICIES:
+            raise ValueError(f"Unknown history policy: {policy}")
+        session_id = session_id or self.current_session_id
+        msgs = self._messages(session_id) if session_id in self.sessions else []
+        used = estimate_tokens(system_prompt) + MESSAGE_TOKEN_OVERHEAD
+        costs = [self.message_tokens(m, session_id) for m in msgs]
+        if budget is None or policy == "all":
+            keep = list(range(len(msgs)))
+            used += sum(costs)
+        else:
+            head = [0] if policy == "first_and_recent" and len(msgs) > 1 else []
+            used += sum(costs[i] for i in head)
+            tail = []
+            for i in range(len(msgs) - 1, len(head) - 1, -1):
+                if tail and used + costs[i] > budget:
+                    break
+                tail.append(i)
+                used += costs[i]
+            tail.reverse()
+            if len(tail) > 1 and tail[0] > len(head) and msgs[tail[0]]["role"] == "assistant":
+                # Don't open the kept turns with a reply whose question was cut
+                used -= costs[tail.pop(0)]
+            keep = head + tail
         history = [{"role": "system", "content": system_prompt}]
-        for msg in self.sessions[self.current_session_id]["messages"]:
-            history.append({"role": msg["role"], "content": msg["content"]})
-        return history
+        history.extend({"role": msgs[i]["role"], "content": msgs[i]["content"]} for i in keep)
+        return history, used, len(msgs) - len(keep)
+
+    def get_conversation_history(self, system_prompt: str, budget: Optional[int] = None, policy: str = "recent",
+                                 session_id: Optional[str] = None) -> List[Dict]:
+        return self.plan_history(system_prompt, budget, policy, session_id)[0]
 
     def delete_session(self, session_id: str):
         if session_id in self.sessions:
-            del self.sessions[session_id]
+            self._commit({"op": "delete_session", "session_id": session_id})
+            self._token_counts.pop(session_id, None)
             if self.current_session_id == session_id:
                 self.current_session_id = None
-            self._save_sessions()
 
     def get_current_messages(self) -> List[Dict]:
         if self.current_session_id in self.sessions:
-            return self.sessions[self.current_session_id]["messages"]
+            return self._messages(self.current_session_id)
         return []
 
 
+class FrameScheduler:
+    """Runs a UI pass repeatedly on the Tk thread, paced by what it costs. Each
+    pass is timed and an EWMA of that cost sets the delay before the next one,
+    so rendering never takes more than about half of wall time: cheap passes
+    run every frame, expensive ones (a big table streaming in on a slow
+    machine) run less often and simply apply larger batches."""
+    SMOOTHING = 0.3
+    MAX_INTERVAL_MS = 250
+
+    def __init__(self, widget: tk.Misc, callback: Callable[[], bool], budget_ms: float = UI_FRAME_MS):
+        self.widget = widget
+        self.callback = callback  # Returns False once there is nothing left to do
+        self.budget_ms = budget_ms
+        self.cost_ms = 0.0
+        self.passes = 0
+        self._job = None
+
+    @property
+    def interval_ms(self) -> int:
+        return int(min(self.MAX_INTERVAL_MS, max(self.budget_ms, 2 * self.cost_ms)))
+
+    def start(self):
+        if self._job is None:
+            self.cost_ms = 0.0
+            self.passes = 0
+            self._job = self.widget.after(int(self.budget_ms), self._tick)
+
+    def stop(self):
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        self._job = None
+        started = time.perf_counter()
+        more = self.callback()
+        cost = (time.perf_counter() - started) * 1000
+        self.cost_ms = cost if not self.passes else self.cost_ms + self.SMOOTHING * (cost - self.cost_ms)
+        self.passes += 1
+        if more and self._job is None:
+            self._job = self.widget.after(self.interval_ms, self._tick)
+
+
+class StreamCheckpoint:
+    """Sidecar journal for the reply currently being streamed. Each write only
+    appends the text received since the previous one, so a checkpoint costs
+    O(delta) however long the reply gets."""
+    EVERY_TOKENS = 32
+    EVERY_SECONDS = 2.0
+
+    def __init__(self, path: str = STREAM_CHECKPOINT_FILE):
+        self.path = path
+        self._file = None
+        self._pending: List[str] = []
+        self._last_write = 0.0
+
+    def begin(self, session_id: str, message_id: str, model: str):
+        try:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._write({
+                "type": "begin", "session_id": session_id, "message_id": message_id,
+                "model": model, "started_at": datetime.now().isoformat()
+            })
+        except OSError as e:
+            print(f"Checkpoint error: {e}")
+            self._file = None
+
+    def add(self, text: str):
+        if self._file is None:
+            return
+        self._pending.append(text)
+        if len(self._pending) >= self.EVERY_TOKENS or time.monotonic() - self._last_write >= self.EVERY_SECONDS:
+            self._write_pending()
+
+    def _write_pending(self):
+        if self._pending:
+            self._write({"type": "delta", "text": ''.join(self._pending)})
+            self._pending.clear()
+
+    def _write(self, record: Dict):
+        try:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except (OSError, ValueError) as e:
+            print(f"Checkpoint error: {e}")
+        self._last_write = time.monotonic()
+
+    def finish(self):
+        """Drop the checkpoint once the reply is safely in the session store."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        self._pending.clear()
+        StreamCheckpoint.discard(self.path)
+
+    @staticmethod
+    def recover(path: str = STREAM_CHECKPOINT_FILE) -> Optional[Dict]:
+        """Return the reply left behind by a crashed stream, if any."""
+        if not os.path.exists(path):
+            return None
+        header = None
+        parts = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn tail from a crash mid-append
+                    if record.get("type") == "begin":
+                        header = record
+                    elif record.get("type") == "delta":
+                        parts.append(record.get("text", ""))
+        except OSError:
+            return None
+        if not header:
+            return None
+        return {**header, "text": ''.join(parts)}
+
+    @staticmethod
+    def discard(path: str = STREAM_CHECKPOINT_FILE):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+
 class MessageWidget(tk.Frame):
     def __init__(self, master, role: str, content: str, index: int, theme: Dict,
-                 on_delete: Callable, on_regenerate: Callable, is_last: bool = False):
+                 on_delete: Callable, on_regenerate: Callable, is_last: bool = False,
+                 incomplete: bool = False, on_continue: Optional[Callable] = None,
+                 pool: Optional[BlockWidgetPool] = None):
         super().__init__(master, bg=theme["bg_primary"])
         self.role = role
         self.content = content
@@ -913,7 +2532,14 @@ class MessageWidget(tk.Frame):
         self.on_delete = on_delete
         self.on_regenerate = on_regenerate
         self.is_last = is_last
+        self.incomplete = incomplete
+        self.on_continue = on_continue
+        self.pool = pool
+        self.incomplete_label = None
         self.renderer = None
+        self.regen_btn = None
+        self.continue_btn = None
+        self.del_btn = None
         self._build()
 
     def _build(self):
@@ -933,9 +2559,9 @@ class MessageWidget(tk.Frame):
         bubble_bg = self.theme["user_bubble"] if is_user else self.theme["ai_bubble"]
         bubble = tk.Frame(container, bg=bubble_bg)
         bubble.pack(fill="x")
-        self.renderer = MessageRenderer(bubble, self.theme, self.role)
+        self.renderer = MessageRenderer(bubble, self.theme, self.role, self.pool)
         self.renderer.pack(fill="both", expand=True)
-        self.renderer.update_content(self.content)
+        self.renderer.update_content(self._content)
         toolbar = tk.Frame(container, bg=self.theme["bg_primary"])
         toolbar.pack(fill="x", pady=(2, 0))
         btn_frame = tk.Frame(toolbar, bg=self.theme["bg_primary"])
@@ -945,25 +2571,37 @@ class MessageWidget(tk.Frame):
             bd=0, padx=4, pady=0, cursor="hand2", activebackground=self.theme["bg_hover"], command=self._copy
         )
         copy_btn.pack(side="left", padx=2)
-        if not is_user and self.is_last:
-            regen_btn = tk.Button(
+        if not is_user:
+            self.regen_btn = tk.Button(
                 btn_frame, text="🔄", font=("Segoe UI", 10), bg=self.theme["bg_primary"], fg=self.theme["text_muted"],
                 bd=0, padx=4, pady=0, cursor="hand2", activebackground=self.theme["bg_hover"], command=self.on_regenerate
             )
-            regen_btn.pack(side="left", padx=2)
-        del_btn = tk.Button(
+            if self.on_continue:
+                self.continue_btn = tk.Button(
+                    btn_frame, text="⏩", font=("Segoe UI", 10), bg=self.theme["bg_primary"], fg=self.theme["text_muted"],
+                    bd=0, padx=4, pady=0, cursor="hand2", activebackground=self.theme["bg_hover"], command=self.on_continue
+                )
+        self.del_btn = tk.Button(
             btn_frame, text="🗑️", font=("Segoe UI", 10), bg=self.theme["bg_primary"], fg=self.theme["text_muted"],
             bd=0, padx=4, pady=0, cursor="hand2", activebackground=self.theme["bg_hover"],
             command=lambda: self.on_delete(self.index)
         )
-        del_btn.pack(side="left", padx=2)
+        self.del_btn.pack(side="left", padx=2)
+        self.set_last(self.is_last)
+        self.incomplete_label = tk.Label(
+            btn_frame, text="⚠ Interrupted", font=("Segoe UI", 9), fg=self.theme["warning"],
+            bg=self.theme["bg_primary"]
+        )
+        if self.incomplete:
+            self.incomplete_label.pack(side="left", padx=6)
         if not is_user:
             tk.Frame(row, bg=self.theme["bg_primary"]).pack(side="right", fill="x", expand=True)
 
     def _copy(self):
-        raw_content = self.renderer.get_raw_content() if self.renderer else self.content
-        plain_text = MarkdownParser.clean_text(raw_content)
-        html_content = markdown_to_html(raw_content)
+        raw_content = self.content
+        doc = parse_markdown(raw_content)
+        plain_text = doc.text
+        html_content = document_to_html(doc)
         
         success = copy_html_to_clipboard(html_content, plain_text)
         
@@ -972,28 +2610,105 @@ class MessageWidget(tk.Frame):
             self.clipboard_append(plain_text)
             self.update()
 
+    @property
+    def content(self) -> str:
+        return self.renderer.get_raw_content() if self.renderer else self._content
+
+    @content.setter
+    def content(self, value: str):
+        self._content = value
+
     def update_content(self, new_content: str):
         self.content = new_content
         if self.renderer:
             self.renderer.update_content(new_content)
 
+    def apply_stream(self, raw: str, cleaned: str, reasoning: str, plan: RenderPlan):
+        if self.renderer:
+            self.renderer.apply_stream(raw, cleaned, reasoning, plan)
+        else:
+            self._content += raw
+
     def set_streaming(self, streaming: bool):
         if self.renderer:
             self.renderer.set_streaming(streaming)
 
+    def set_incomplete(self, incomplete: bool):
+        self.incomplete = incomplete
+        if self.incomplete_label:
+            if incomplete:
+                self.incomplete_label.pack(side="left", padx=6)
+            else:
+                self.incomplete_label.pack_forget()
+
+    def set_last(self, is_last: bool):
+        """Regenerate and continue are only offered on the newest reply."""
+        self.is_last = is_last
+        for btn in (self.regen_btn, self.continue_btn):
+            if btn is None:
+                continue
+            if is_last:
+                btn.pack(side="left", padx=2, before=self.del_btn)
+            else:
+                btn.pack_forget()
+
+    def rebind(self, content: str, index: int, is_last: bool, incomplete: bool):
+        """Show another message of the same role in this widget (list recycling)."""
+        self.index = index
+        self.set_last(is_last)
+        self.set_incomplete(incomplete)
+        if content != self.content:
+            self.update_content(content)
+
+
+class _MessageSlot:
+    """One message in the virtual list: its data, its height (estimated until a
+    widget has measured it) and, while near the viewport, the widget drawing it."""
+    __slots__ = ("key", "role", "content", "index", "is_last", "incomplete", "height", "measured", "width",
+                 "widget", "window")
+
+    def __init__(self, key: str, role: str, content: str, index: int, is_last: bool, incomplete: bool):
+        self.key = key  # Message id
+        self.role = role
+        self.content = content
+        self.index = index
+        self.is_last = is_last
+        self.incomplete = incomplete
+        self.height = 0
+        self.measured = False
+        self.width = 0  # Width the widget was last laid out (and measured) at
+        self.widget: Optional[MessageWidget] = None
+        self.window = None
+
 
 class ChatArea(tk.Frame):
+    OVERSCAN = 600  # Pixels above and below the viewport kept materialised
+    POOL_LIMIT = 6  # Detached widgets kept per role for reuse
+    RESIZE_DEBOUNCE_MS = 150  # Quiet time after the last resize before off-screen work
+
     def __init__(self, master, session_manager: SessionManager, theme: Dict):
         super().__init__(master, bg=theme["bg_primary"])
         self.session_manager = session_manager
         self.theme = theme
-        self.message_widgets: List[MessageWidget] = []
+        self._slots: List[_MessageSlot] = []
+        self._offsets: List[int] = [0]  # Top of every slot, plus the total height
+        self._pool: Dict[str, List[MessageWidget]] = {"user": [], "assistant": []}
+        self._widget_slots: Dict[MessageWidget, _MessageSlot] = {}
+        self._pinned: Optional[_MessageSlot] = None  # Streaming message, never recycled
+        # Layout state resolved together in one idle pass by _flush_layout
+        self._layout_job = None
+        self._layout_dirty = False
+        self._clamp_needed = False
+        self._scroll_request: Optional[str] = None
+        self._width = 1  # Current canvas width; message windows are brought to it lazily
+        self._resize_job = None
         self.on_send_callback: Optional[Callable] = None
         self.on_regenerate_callback: Optional[Callable] = None
+        self.on_continue_callback: Optional[Callable] = None
+        self.on_delete_callback: Optional[Callable] = None
         self.on_stop_callback: Optional[Callable] = None 
         self._is_streaming = False
         self._auto_scroll_enabled = True
-        self._scroll_job_id = None
         self._build_ui()
 
     def _build_ui(self):
@@ -1005,13 +2720,12 @@ class ChatArea(tk.Frame):
         scroll_container.grid_columnconfigure(0, weight=1)
         self.canvas = tk.Canvas(scroll_container, bg=self.theme["bg_primary"], highlightthickness=0, bd=0)
         self.canvas.grid(row=0, column=0, sticky="nsew")
-        scrollbar = tk.Scrollbar(scroll_container, orient="vertical", command=self._on_scrollbar)
-        scrollbar.grid(row=0, column=1, sticky="ns")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        self.messages_frame = tk.Frame(self.canvas, bg=self.theme["bg_primary"])
-        self.canvas_window = self.canvas.create_window((0, 0), window=self.messages_frame, anchor="nw")
-        self.messages_frame.bind("<Configure>", self._on_frame_configure)
+        self.scrollbar = tk.Scrollbar(scroll_container, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
         self.canvas.bind("<Configure>", self._on_canvas_configure)
+        # Block widgets live on the canvas so the pool can move them between messages
+        self.block_pool = BlockWidgetPool(self.canvas, self.theme)
         self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
         input_container = tk.Frame(self, bg=self.theme["bg_secondary"], height=100)
         input_container.grid(row=1, column=0, sticky="ew")
@@ -1031,24 +2745,51 @@ class ChatArea(tk.Frame):
             padx=16, pady=8, cursor="hand2", activebackground=self.theme["accent_hover"], command=self._on_send
         )
         self.send_btn.pack(side="right", padx=8, pady=8)
-        hint = tk.Label(
+        self.hint = tk.Label(
             input_container, text="Ctrl+Enter to send", font=("Segoe UI", 9),
             fg=self.theme["text_muted"], bg=self.theme["bg_secondary"]
         )
-        hint.pack(pady=(0, 8))
+        self.hint.pack(pady=(0, 8))
+        self.token_gauge = tk.Label(
+            input_container, text="", font=("Segoe UI", 9),
+            fg=self.theme["text_muted"], bg=self.theme["bg_secondary"]
+        )
+        self.token_gauge.place(relx=1.0, rely=1.0, x=-40, y=-8, anchor="se")
 
     def _on_scrollbar(self, *args):
         """Handle scrollbar interaction with bounds checking"""
         self.canvas.yview(*args)
-        self._clamp_scroll()
+        self._request_layout(clamp=True)
 
-    def _on_frame_configure(self, event=None):
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        self._clamp_scroll()
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._request_layout()
 
     def _on_canvas_configure(self, event):
-        self.canvas.itemconfig(self.canvas_window, width=event.width)
-        self._clamp_scroll()
+        """Reflow only the messages on screen now; the rest waits until the
+        resize has settled, or until they scroll into view."""
+        if event.width == self._width:
+            return
+        self._width = event.width
+        first, last = self._visible_range(0)
+        for slot in self._slots[first:last + 1]:
+            self._fit_width(slot)
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(self.RESIZE_DEBOUNCE_MS, self._finish_resize)
+
+    def _finish_resize(self):
+        self._resize_job = None
+        for slot in self._slots:
+            if slot.window is None and slot.measured and slot.width != self._width:
+                slot.measured = False  # Wrapped at another width; fall back to an estimate
+                slot.height = self._estimate_height(slot)
+        self._request_layout(relayout=True)
+
+    def _fit_width(self, slot: _MessageSlot):
+        if slot.window is not None and slot.width != self._width:
+            self.canvas.itemconfig(slot.window, width=self._width)
+            slot.width = self._width
 
     def _on_mousewheel(self, event):
         # During streaming, user scroll disables auto-scroll temporarily
@@ -1061,18 +2802,14 @@ class ChatArea(tk.Frame):
                 self._check_near_bottom()
         
         self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
-        self._clamp_scroll()
+        self._request_layout(clamp=True)
 
     def _clamp_scroll(self):
         """Prevent scrolling beyond content bounds"""
-        self.canvas.update_idletasks()
-        
-        # Get scroll region and canvas info
-        bbox = self.canvas.bbox("all")
-        if not bbox:
+        # Cached content height; no forced geometry pass
+        content_height = self._offsets[-1]
+        if not content_height:
             return
-            
-        content_height = bbox[3] - bbox[1]
         canvas_height = self.canvas.winfo_height()
         
         if content_height <= canvas_height:
@@ -1107,74 +2844,245 @@ class ChatArea(tk.Frame):
             self.on_send_callback(text)
         return "break"
 
-    def clear_messages(self):
-        for w in self.messages_frame.winfo_children():
-            w.destroy()
-        self.message_widgets.clear()
+    def _estimate_height(self, slot: _MessageSlot) -> int:
+        """Rough height of a message that has never been drawn at this width."""
+        chars_per_line = max(20, (self.canvas.winfo_width() - 120) // 8)
+        lines = sum(len(line) // chars_per_line + 1 for line in slot.content.split('\n'))
+        return 76 + lines * 20
+
+    def _relayout(self):
+        """Recompute slot offsets and move the materialised windows, keeping the
+        message at the top of the view (or the bottom, when following) in place."""
+        total = self._offsets[-1]
+        view_top, view_bottom = self.canvas.yview()
+        at_bottom = view_bottom >= 0.999
+        anchor = None
+        if total and not at_bottom:
+            top = view_top * total
+            idx = max(0, bisect.bisect_right(self._offsets, top) - 1)
+            if idx < len(self._slots):
+                anchor = (self._slots[idx], top - self._offsets[idx])
+        offsets = [0]
+        for slot in self._slots:
+            if slot.window is not None:
+                self.canvas.coords(slot.window, 0, offsets[-1])
+            offsets.append(offsets[-1] + slot.height)
+        self._offsets = offsets
+        total = offsets[-1]
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), total))
+        if at_bottom:
+            self.canvas.yview_moveto(1.0)
+        elif anchor and total:
+            slot, delta = anchor
+            if slot.index < len(self._slots) and self._slots[slot.index] is slot:
+                self.canvas.yview_moveto((offsets[slot.index] + delta) / total)
+        self._clamp_needed = True
+
+    def _request_layout(self, relayout: bool = False, scroll: Optional[str] = None, clamp: bool = False):
+        """Mark layout work as needed; it is all done in the next idle pass.
+        ``scroll`` is "bottom" (always) or "follow" (unless the user has
+        scrolled away while a reply streams)."""
+        self._layout_dirty = self._layout_dirty or relayout
+        self._clamp_needed = self._clamp_needed or clamp
+        if scroll == "bottom" or (scroll and self._scroll_request is None):
+            self._scroll_request = scroll
+        if self._layout_job is None:
+            self._layout_job = self.after_idle(self._flush_layout)
+
+    def flush_layout(self):
+        """Resolve pending layout now rather than at idle, so a caller that
+        times its pass (the stream pump) is charged for it."""
+        if self._layout_job is not None:
+            self.after_cancel(self._layout_job)
+            self._flush_layout()
+
+    def _flush_layout(self):
+        """The one place that resolves layout: slot offsets and scroll region,
+        auto-scroll, clamping, then which messages are materialised. However
+        many heights changed or scroll requests came in, this runs once."""
+        self._layout_job = None
+        if self._layout_dirty:
+            self._layout_dirty = False
+            self._relayout()
+        scroll, self._scroll_request = self._scroll_request, None
+        if scroll == "bottom" or (scroll == "follow" and (not self._is_streaming or self._auto_scroll_enabled)):
+            self.canvas.yview_moveto(1.0)
+        if self._clamp_needed:
+            self._clamp_needed = False
+            self._clamp_scroll()
+        self._update_viewport()
+
+    def _visible_range(self, overscan: int) -> tuple:
+        """Indices of the first and last slot within ``overscan`` pixels of the view."""
+        total = self._offsets[-1]
+        top = self.canvas.yview()[0] * total
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, bisect.bisect_right(self._offsets, top - overscan) - 1)
+        last = min(len(self._slots) - 1, bisect.bisect_left(self._offsets, bottom + overscan))
+        return first, last
+
+    def _update_viewport(self):
+        """Materialise the messages near the viewport and recycle the rest.
+        Those actually on screen are brought to the current width."""
+        if not self._slots:
+            return
+        first, last = self._visible_range(self.OVERSCAN)
+        for slot in self._slots:
+            if slot.widget is not None and not first <= slot.index <= last and slot is not self._pinned:
+                self._release(slot)
+        for idx in range(first, last + 1):
+            self._materialise(self._slots[idx])
+        first, last = self._visible_range(0)
+        for slot in self._slots[first:last + 1]:
+            self._fit_width(slot)
+
+    def _materialise(self, slot: _MessageSlot):
+        """Give a slot a widget. Its real height arrives with the widget's
+        <Configure>; until then the slot keeps its estimate."""
+        if slot.widget is None:
+            pool = self._pool.setdefault(slot.role, [])
+            if pool:
+                widget = pool.pop()
+                widget.rebind(slot.content, slot.index, slot.is_last, slot.incomplete)
+            else:
+                widget = MessageWidget(
+                    self.canvas, role=slot.role, content=slot.content, index=slot.index, theme=self.theme,
+                    on_delete=self._on_delete, on_regenerate=self._on_regenerate, is_last=slot.is_last,
+                    incomplete=slot.incomplete, on_continue=self._on_continue, pool=self.block_pool
+                )
+                widget.bind("<Configure>", lambda e, w=widget: self._on_item_configure(w, e.height))
+            slot.widget = widget
+            self._widget_slots[widget] = slot
+            # Offsets may not cover slots added since the last layout pass; that pass moves it
+            if slot.width != self._width:
+                slot.measured = False  # Its height was measured at another width
+            slot.window = self.canvas.create_window(
+                (0, self._offsets[min(slot.index, len(self._offsets) - 1)]), window=widget, anchor="nw",
+                width=self._width
+            )
+            slot.width = self._width
+
+    def _release(self, slot: _MessageSlot):
+        widget = slot.widget
+        self.canvas.delete(slot.window)
+        slot.widget = None
+        slot.window = None
+        self._widget_slots.pop(widget, None)
+        pool = self._pool.setdefault(slot.role, [])
+        if slot is self._pinned:
+            # The stream may still hold this widget; pooled, it would draw into another message
+            self._pinned = None
+            widget.destroy()
+        elif len(pool) < self.POOL_LIMIT:
+            pool.append(widget)
+        else:
+            widget.destroy()
 
-    def add_message(self, role: str, content: str, index: int, is_last: bool = False) -> MessageWidget:
-        widget = MessageWidget(
-            self.messages_frame, role=role, content=content, index=index, theme=self.theme,
-            on_delete=self._on_delete, on_regenerate=self._on_regenerate, is_last=is_last
-        )
-        widget.pack(fill="x", pady=2)
-        self.message_widgets.append(widget)
-        self.after_idle(self._smart_scroll_to_bottom)
-        return widget
+    def _on_item_configure(self, widget: MessageWidget, height: int):
+        slot = self._widget_slots.get(widget)
+        if slot is None or (slot.measured and slot.height == height):
+            return
+        slot.height = height
+        slot.measured = True
+        self._request_layout(relayout=True)
+
+    def clear_messages(self):
+        for slot in self._slots:
+            if slot.widget is not None:
+                self._release(slot)
+        self._slots.clear()
+        self._pinned = None
+        self._request_layout(relayout=True)
+
+    def add_message(self, role: str, content: str, index: int, is_last: bool = False,
+                    incomplete: bool = False, key: Optional[str] = None) -> MessageWidget:
+        slot = _MessageSlot(key or str(uuid.uuid4()), role, content, len(self._slots), is_last, incomplete)
+        slot.height = self._estimate_height(slot)
+        self._slots.append(slot)
+        self._materialise(slot)
+        slot.widget.index = index
+        if self._is_streaming:
+            self._pinned = slot
+        self._request_layout(relayout=True, scroll="follow")
+        return slot.widget
+
+    def last_message_widget(self) -> Optional[MessageWidget]:
+        """The newest message's widget, materialised and kept alive while streaming."""
+        if not self._slots:
+            return None
+        slot = self._slots[-1]
+        self._materialise(slot)
+        if self._is_streaming:
+            self._pinned = slot
+        return slot.widget
 
     def _on_delete(self, index: int):
-        self.session_manager.delete_message(index)
-        self.reload_messages()
+        if self.on_delete_callback:
+            self.on_delete_callback(index)
 
     def _on_regenerate(self):
         if self.on_regenerate_callback:
             self.on_regenerate_callback()
 
+    def _on_continue(self):
+        if self.on_continue_callback:
+            self.on_continue_callback()
+
     def reload_messages(self):
         self.clear_messages()
+        self.sync_messages()
+        self.scroll_to_bottom()
+
+    def sync_messages(self):
+        """Bring the list in line with the current session, keyed by message id:
+        unchanged messages keep their slot and widget, only the difference is built."""
         messages = self.session_manager.get_current_messages()
+        old = {slot.key: slot for slot in self._slots}
+        slots = []
+        added = False
         for idx, msg in enumerate(messages):
-            self.add_message(msg["role"], msg["content"], idx, is_last=(idx == len(messages) - 1))
+            is_last = idx == len(messages) - 1
+            incomplete = msg.get("incomplete", False)
+            slot = old.pop(msg["id"], None)
+            if slot is None:
+                slot = _MessageSlot(msg["id"], msg["role"], msg["content"], idx, is_last, incomplete)
+                slot.height = self._estimate_height(slot)
+                added = True
+            elif (slot.content, slot.index, slot.is_last, slot.incomplete) != (msg["content"], idx, is_last, incomplete):
+                slot.content, slot.index, slot.is_last, slot.incomplete = msg["content"], idx, is_last, incomplete
+                if slot is self._pinned:
+                    slot.widget.index = idx
+                elif slot.widget is not None:
+                    slot.widget.rebind(slot.content, idx, is_last, incomplete)
+            slots.append(slot)
+        pinned = self._pinned
+        if pinned is not None and old.pop(pinned.key, None) is pinned:
+            # Still streaming, so not in the session yet
+            pinned.index = pinned.widget.index = len(slots)
+            slots.append(pinned)
+        for slot in old.values():
+            if slot.widget is not None:
+                self._release(slot)
+        self._slots = slots
+        self._request_layout(relayout=True, scroll="follow" if added else None)
 
     def scroll_to_bottom(self):
-        """Immediate scroll to bottom"""
-        self.update_idletasks()
-        self.canvas.yview_moveto(1.0)
-
-    def _smart_scroll_to_bottom(self):
-        """Smart scroll that respects user interaction during streaming"""
-        if self._is_streaming and not self._auto_scroll_enabled:
-            return
-        
-        # Cancel any pending scroll job to avoid buildup
-        if self._scroll_job_id:
-            self.after_cancel(self._scroll_job_id)
-            self._scroll_job_id = None
-        
-        self.update_idletasks()
-        self.canvas.yview_moveto(1.0)
+        """Scroll to the bottom in the next layout pass, whatever the user did."""
+        self._request_layout(scroll="bottom")
 
     def request_scroll_to_bottom(self):
-        """Request scroll to bottom with debouncing for performance"""
-        if self._is_streaming and not self._auto_scroll_enabled:
-            return
-        
-        # Debounce: cancel previous job and schedule new one
-        if self._scroll_job_id:
-            self.after_cancel(self._scroll_job_id)
-        
-        self._scroll_job_id = self.after(50, self._do_scroll_to_bottom)
-
-    def _do_scroll_to_bottom(self):
-        """Actual scroll execution"""
-        self._scroll_job_id = None
-        if self._is_streaming and not self._auto_scroll_enabled:
-            return
-        self.update_idletasks()
-        self.canvas.yview_moveto(1.0)
+        """Follow the bottom while streaming, unless the user scrolled away.
+        Any number of calls per frame cost one layout pass."""
+        self._request_layout(scroll="follow")
 
     def set_streaming_mode(self, streaming: bool):
         self._is_streaming = streaming
+        if not streaming and self._pinned is not None:
+            # Keep the slot in step with what was streamed into its widget
+            slot, widget = self._pinned, self._pinned.widget
+            slot.content, slot.is_last, slot.incomplete = widget.content, widget.is_last, widget.incomplete
+            self._pinned = None
+            self._request_layout()
         if streaming:
             self._auto_scroll_enabled = True  # Reset auto-scroll when starting
             self.send_btn.configure(text="⏹", bg=self.theme["error"])
@@ -1182,7 +3090,23 @@ class ChatArea(tk.Frame):
             self._auto_scroll_enabled = True  # Ensure it's enabled when done
             self.send_btn.configure(text="➤", bg=self.theme["accent"])
             # Final scroll to bottom
-            self.after_idle(self.scroll_to_bottom)
+            self.scroll_to_bottom()
+
+    def set_token_gauge(self, used: int, total: int, dropped: int = 0):
+        text = f"{used:,} of {total:,} tokens"
+        if dropped:
+            text += f" · {dropped} older message{'s' if dropped != 1 else ''} left out"
+        self.token_gauge.configure(text=text, fg=self.theme["warning"] if dropped else self.theme["text_muted"])
+
+    def show_generation_stats(self, stats: Optional[Dict]):
+        """Server timings of the last reply next to the send hint."""
+        text = "Ctrl+Enter to send"
+        if stats and stats.get("eval"):
+            text += f"  ·  {stats['tokens']} tokens, {stats['tokens'] / stats['eval']:.1f} tok/s"
+            text += f"  ·  prompt {stats['prompt_tokens']} in {stats['prompt_eval']:.1f}s"
+            if stats["load"] >= 0.1:
+                text += f"  ·  load {stats['load']:.1f}s"
+        self.hint.configure(text=text)
 
 
 class Sidebar(tk.Frame):
@@ -1235,16 +3159,12 @@ class Sidebar(tk.Frame):
     def refresh_sessions(self):
         for w in self.sessions_frame.winfo_children():
             w.destroy()
-        sorted_sessions = sorted(
-            self.session_manager.sessions.items(),
-            key=lambda x: x[1].get('updated_at', x[1].get('created_at', '')), reverse=True
-        )
-        for sid, data in sorted_sessions:
+        for sid, title, _updated_at in self.session_manager.list_sessions():
             is_current = sid == self.session_manager.current_session_id
             bg = self.theme["accent"] if is_current else self.theme["bg_secondary"]
             frame = tk.Frame(self.sessions_frame, bg=bg)
             frame.pack(fill="x", pady=2)
-            title = data["title"][:22] + "..." if len(data["title"]) > 22 else data["title"]
+            title = title[:22] + "..." if len(title) > 22 else title
             btn = tk.Button(
                 frame, text=title, font=("Segoe UI", 10), bg=bg, fg=self.theme["text_primary"], bd=0,
                 anchor="w", padx=8, pady=6, cursor="hand2", activebackground=self.theme["bg_hover"],
@@ -1282,6 +3202,8 @@ class ConfigPanel(tk.Frame):
         self.on_refresh_models: Optional[Callable] = None
         self.on_browse_ollama: Optional[Callable] = None
         self.on_model_changed: Optional[Callable] = None
+        self.on_think_changed: Optional[Callable] = None
+        self.on_context_changed: Optional[Callable] = None
         self._build_ui()
 
     def _build_ui(self):
@@ -1327,7 +3249,7 @@ class ConfigPanel(tk.Frame):
         
         self._section(scroll_frame, "Model")
         model_row = tk.Frame(scroll_frame, bg=self.theme["bg_secondary"])
-        model_row.pack(fill="x", padx=15, pady=(0, 10))
+        model_row.pack(fill="x", padx=15, pady=(0, 4))
         
         self.model_var = tk.StringVar(value="No models")
         self.model_combo = tk.OptionMenu(model_row, self.model_var, "No models")
@@ -1342,6 +3264,20 @@ class ConfigPanel(tk.Frame):
         )
         refresh_btn.pack(side="right", padx=(5, 0))
         
+        self.model_status = tk.Label(scroll_frame, text="○ Not loaded", font=("Segoe UI", 9),
+                                     fg=self.theme["text_muted"], bg=self.theme["bg_secondary"], anchor="w")
+        self.model_status.pack(fill="x", padx=15, pady=(0, 10))
+        
+        self._section(scroll_frame, "Reasoning")
+        self.think_var = tk.IntVar(value=1)
+        think_chk = tk.Checkbutton(
+            scroll_frame, text="Think before answering (this chat)", font=("Segoe UI", 10),
+            fg=self.theme["text_secondary"], bg=self.theme["bg_secondary"],
+            selectcolor=self.theme["bg_tertiary"], anchor="w", variable=self.think_var,
+            command=lambda: self.on_think_changed(self.think_var.get() == 1) if self.on_think_changed else None
+        )
+        think_chk.pack(fill="x", padx=15, pady=(0, 10))
+        
         self._section(scroll_frame, "System Prompt")
         self.system_prompt = tk.Text(
             scroll_frame, height=5, wrap="word", font=("Segoe UI", 10), 
@@ -1383,9 +3319,26 @@ class ConfigPanel(tk.Frame):
             scroll_frame, from_=512, to=131072, orient="horizontal", 
             variable=self.ctx_var, bg=self.theme["bg_secondary"], 
             fg=self.theme["text_primary"], highlightthickness=0, 
-            troughcolor=self.theme["bg_tertiary"]
+            troughcolor=self.theme["bg_tertiary"],
+            command=lambda v: self.on_context_changed() if self.on_context_changed else None
         )
-        self.ctx_scale.pack(fill="x", padx=15, pady=(0, 15))
+        self.ctx_scale.pack(fill="x", padx=15, pady=(0, 10))
+        
+        self._section(scroll_frame, "Advanced")
+        tk.Label(scroll_frame, text="Leave blank for the server default", font=("Segoe UI", 9),
+                 fg=self.theme["text_muted"], bg=self.theme["bg_secondary"], anchor="w").pack(fill="x", padx=15)
+        grid = tk.Frame(scroll_frame, bg=self.theme["bg_secondary"])
+        grid.pack(fill="x", padx=15, pady=(5, 15))
+        grid.columnconfigure(1, weight=1)
+        self.option_entries: Dict[str, tk.Entry] = {}
+        fields = [("keep_alive", "Keep loaded")] + [(key, label) for key, label, _ in OLLAMA_OPTIONS]
+        for row, (key, label) in enumerate(fields):
+            tk.Label(grid, text=label, font=("Segoe UI", 10), fg=self.theme["text_secondary"],
+                     bg=self.theme["bg_secondary"], anchor="w").grid(row=row, column=0, sticky="w", pady=2)
+            entry = tk.Entry(grid, font=("Segoe UI", 10), width=10, bg=self.theme["bg_tertiary"],
+                             fg=self.theme["text_primary"], relief="flat", bd=1)
+            entry.grid(row=row, column=1, sticky="ew", padx=(8, 0), pady=2)
+            self.option_entries[key] = entry
 
     def _section(self, parent, title: str):
         tk.Label(parent, text=title, font=("Segoe UI", 11, "bold"), fg=self.theme["text_primary"], bg=self.theme["bg_secondary"], anchor="w").pack(fill="x", padx=15, pady=(10, 5))
@@ -1404,6 +3357,19 @@ class ConfigPanel(tk.Frame):
         if self.ctx_var.get() > max_val:
             self.ctx_var.set(max_val)
 
+    def set_model_status(self, state: str, vram: int = 0, swaps: int = 0):
+        suffix = f" · {swaps} swap{'s' if swaps != 1 else ''}" if swaps else ""
+        if state == "loaded":
+            text = f"● Loaded · {vram / 1024 ** 3:.1f} GB VRAM" if vram else "● Loaded (CPU)"
+            self.model_status.configure(text=text + suffix, fg=self.theme["success"])
+        elif state == "loading":
+            self.model_status.configure(text="◌ Loading…" + suffix, fg=self.theme["warning"])
+        else:
+            self.model_status.configure(text="○ Not loaded" + suffix, fg=self.theme["text_muted"])
+
+    def set_think(self, enabled: bool):
+        self.think_var.set(1 if enabled else 0)
+
     def get_settings(self) -> Dict:
         return {
             "system_prompt": self.system_prompt.get("1.0", "end").strip(),
@@ -1412,9 +3378,21 @@ class ConfigPanel(tk.Frame):
             "model": self.model_var.get(),
             "temperature": self.temp_var.get(),
             "context_length": self.ctx_var.get(),
-            "theme": "Dark" if self.theme_var.get() == 1 else "Light"
+            "theme": "Dark" if self.theme_var.get() == 1 else "Light",
+            "keep_alive": self.option_entries["keep_alive"].get().strip(),
+            **self._option_values()
         }
 
+    def _option_values(self) -> Dict:
+        values = {}
+        for key, _, cast in OLLAMA_OPTIONS:
+            text = self.option_entries[key].get().strip()
+            try:
+                values[key] = cast(text) if text else None
+            except ValueError:
+                values[key] = None
+        return values
+
     def load_settings(self, settings: Dict):
         if "system_prompt" in settings:
             self.system_prompt.delete("1.0", "end")
@@ -1431,6 +3409,10 @@ class ConfigPanel(tk.Frame):
             self.temp_var.set(settings["temperature"])
         if "context_length" in settings:
             self.ctx_var.set(settings["context_length"])
+        for key, entry in self.option_entries.items():
+            if key in settings:
+                entry.delete(0, "end")
+                entry.insert(0, "" if settings[key] is None else str(settings[key]))
 
     def update_models(self, models: List[str]):
         if models:
@@ -1486,18 +3468,224 @@ class OllamaManager:
             pass
 
 
+class OllamaClient:
+    """The one HTTP layer to the Ollama server. A requests.Session keeps
+    connections to the native API alive, and a single OpenAI client keeps its
+    own pool for the compatible endpoint; every call site shares them, so
+    status checks and new chats reuse warm sockets. The latest timing of
+    each kind of request is kept in ``timings`` (seconds)."""
+
+    def __init__(self, base_url: str = OLLAMA_API_BASE):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._openai: Optional[OpenAI] = None
+        self._lock = threading.Lock()
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def openai(self) -> OpenAI:
+        with self._lock:
+            if self._openai is None:
+                self._openai = OpenAI(base_url=OLLAMA_CHAT_URL, api_key=API_KEY)
+            return self._openai
+
+    def record(self, name: str, **timing: float):
+        self.timings[name] = {**timing, "at": time.time()}
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self._request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self._request("POST", path, **kwargs)
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        resp = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        # elapsed stops at the response headers: time to first byte
+        self.record(path, ttfb=resp.elapsed.total_seconds(), total=time.perf_counter() - start)
+        return resp
+
+    @staticmethod
+    def chat_options(settings: Dict) -> Dict:
+        """The ``options`` object for /api/chat; unset fields keep the server default."""
+        options = {"temperature": settings.get("temperature", 0.7),
+                   "num_ctx": int(settings.get("context_length", 4096))}
+        for key, _, _ in OLLAMA_OPTIONS:
+            if settings.get(key) is not None:
+                options[key] = settings[key]
+        return options
+
+    @staticmethod
+    def keep_alive(settings: Dict):
+        """Duration string ("30m"), seconds, or -1 to keep the model loaded forever."""
+        value = str(settings.get("keep_alive", DEFAULT_KEEP_ALIVE)).strip()
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return value
+
+    @staticmethod
+    def generation_stats(data: Dict) -> Dict[str, float]:
+        """Server-side timings from the final /api/chat chunk, in seconds."""
+        ns = 1e9
+        return {
+            "load": data.get("load_duration", 0) / ns,
+            "prompt_tokens": data.get("prompt_eval_count", 0),
+            "prompt_eval": data.get("prompt_eval_duration", 0) / ns,
+            "tokens": data.get("eval_count", 0),
+            "eval": data.get("eval_duration", 0) / ns,
+            "total": data.get("total_duration", 0) / ns,
+        }
+
+    def is_up(self, timeout: float = 1) -> bool:
+        try:
+            return self.get("/api/tags", timeout=timeout).status_code == 200
+        except:
+            return False
+
+    def warm(self):
+        """Open the OpenAI client's connection ahead of the first chat."""
+        def run():
+            try:
+                start = time.perf_counter()
+                self.openai.models.list()
+                self.record("/v1/models", total=time.perf_counter() - start)
+            except:
+                pass
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        try:
+            self.session.close()
+            if self._openai is not None:
+                self._openai.close()
+        except:
+            pass
+
+
+class ModelResidency:
+    """Tracks which models the server holds in memory by polling /api/ps, and
+    loads a model ahead of its first message with an empty /api/chat request.
+    Polls run on the poller and preload threads, never the Tk thread;
+    ``on_change`` is called from them whenever the state moves."""
+
+    POLL_SECONDS = 10
+
+    def __init__(self, client: OllamaClient, on_change: Optional[Callable] = None):
+        self.client = client
+        self.on_change = on_change
+        self.loaded: Dict[str, Dict] = {}
+        self.loading: set = set()
+        self.online = False
+        self.swaps = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()  # One poll at a time, so an eviction is counted once
+        self._thread: Optional[threading.Thread] = None
+
+    def status(self, model: str) -> Tuple[str, int, int]:
+        """("loading" | "loaded" | "unloaded", bytes of VRAM in use, model swaps so far)."""
+        if model in self.loading:
+            return "loading", 0, self.swaps
+        if model in self.loaded:
+            return "loaded", self.loaded[model].get("size_vram", 0), self.swaps
+        return "unloaded", 0, self.swaps
+
+    def start(self):
+        """Called once the server answered, so preloads may go out before the first poll."""
+        self.online = True
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        else:
+            self._wake.set()
+
+    def refresh(self):
+        """Poll now rather than at the next interval."""
+        self._wake.set()
+
+    def stop(self):
+        """End the poller; nothing is reported after this, as the UI may be gone."""
+        self._stopped.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.poll()
+            self._wake.wait(self.POLL_SECONDS)
+            self._wake.clear()
+
+    def poll(self):
+        with self._lock:
+            try:
+                resp = self.client.get("/api/ps", timeout=2)
+                self.online = resp.status_code == 200
+                models = resp.json().get("models", []) if self.online else []
+            except:
+                self.online = False
+                models = []
+            loaded = {m["name"]: m for m in models}
+            added, removed = loaded.keys() - self.loaded.keys(), self.loaded.keys() - loaded.keys()
+            if added and removed:
+                # A model came in as another went out: the server evicted one for the other
+                self.swaps += len(added)
+            changed = loaded.keys() != self.loaded.keys() or any(
+                m.get("size_vram") != self.loaded[name].get("size_vram") for name, m in loaded.items())
+            self.loaded = loaded
+        if changed:
+            self._changed()
+
+    def preload(self, model: str, settings: Dict):
+        """Load ``model`` in the background with the same num_ctx the chat will
+        ask for, so the first message does not pay for a reload."""
+        if not self.online or not model or model in self.loading or model in self.loaded:
+            return
+        self.loading.add(model)
+        self._changed()
+
+        def run():
+            payload = {"model": model, "messages": [], "options": OllamaClient.chat_options(settings)}
+            keep_alive = OllamaClient.keep_alive(settings)
+            if keep_alive is not None:
+                payload["keep_alive"] = keep_alive
+            try:
+                start = time.perf_counter()
+                self.client.post("/api/chat", json=payload, timeout=(5, None)).raise_for_status()
+                self.client.record("preload", total=time.perf_counter() - start)
+            except Exception as e:
+                print(f"Preload error: {e}")
+            self.loading.discard(model)
+            self.poll()
+            self._changed()
+        threading.Thread(target=run, daemon=True).start()
+
+    def _changed(self):
+        if self.on_change and not self._stopped.is_set():
+            self.on_change()
+
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.title("Ollama Chat Interface")
         self.geometry("1400x900")
         self.minsize(1000, 700)
-        self.session_manager = SessionManager()
         self.settings = self._load_settings()
+        self.session_manager = SessionManager(self.settings.get("session_store", "json"))
         self.ollama_manager = OllamaManager()
+        self.client = OllamaClient()
+        self.residency = ModelResidency(self.client, lambda: self.after(0, self._show_residency))
         self.is_streaming = False
         self.abort_stream = False
         self.current_ai_widget: Optional[MessageWidget] = None
+        self._stream_updates: "queue.Queue" = queue.Queue()
+        self._gauge_job = None
+        self._pump = FrameScheduler(self, self._pump_stream)
         self.ollama_path = self.settings.get("ollama_path", DEFAULT_OLLAMA_PATH)
         ctk.set_appearance_mode(self.settings.get("theme", "Dark"))
         self.theme = Theme.get()
@@ -1505,12 +3693,18 @@ class App(ctk.CTk):
         self._connect_events()
         self._apply_settings()
         self.sidebar.refresh_sessions()
+        self._sync_session_options()
         self._check_ollama()
         self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(200, self._recover_checkpoint)
 
     def _on_close(self):
         self._save_settings()
+        self.session_manager.close()
         self.ollama_manager.cleanup()
+        self._pump.stop()
+        self.residency.stop()
+        self.client.close()
         self.destroy()
 
     def _load_settings(self) -> Dict:
@@ -1518,20 +3712,34 @@ class App(ctk.CTk):
             "system_prompt": "You are a helpful AI assistant.",
             "prefix": "", "suffix": "", "model": "qwen3:1.7b",
             "temperature": 0.7, "context_length": 4096, "theme": "Dark",
-            "ollama_path": DEFAULT_OLLAMA_PATH
+            "ollama_path": DEFAULT_OLLAMA_PATH, "session_store": "json", "api": "native",
+            "history_policy": "recent", "reply_reserve": 1024,
+            "keep_alive": DEFAULT_KEEP_ALIVE, **{key: None for key, _, _ in OLLAMA_OPTIONS},
+            "progressive_render_chars": MessageRenderer.PROGRESSIVE_CHARS,
+            "collapse_block_lines": MessageRenderer.COLLAPSE_LINES
         }
+        settings = defaults
         if os.path.exists(SETTINGS_FILE):
             try:
                 with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                    return {**defaults, **json.load(f)}
+                    settings = {**defaults, **json.load(f)}
             except:
                 pass
-        return defaults
+        if settings["history_policy"] not in SessionManager.HISTORY_POLICIES:
+            print(f"Unknown history_policy {settings['history_policy']!r}, using 'recent' "
+                  f"(choose from {', '.join(SessionManager.HISTORY_POLICIES)})")
+            settings["history_policy"] = "recent"
+        return settings
 
     def _save_settings(self):
         try:
             settings = self.config_panel.get_settings()
             settings["ollama_path"] = self.ollama_path
+            # Keys only editable in settings.json
+            for key in ("session_store", "api", "history_policy", "reply_reserve",
+                        "progressive_render_chars", "collapse_block_lines"):
+                if key in self.settings:
+                    settings[key] = self.settings[key]
             with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
             self.settings = settings
@@ -1539,6 +3747,8 @@ class App(ctk.CTk):
             pass
 
     def _apply_settings(self):
+        MessageRenderer.PROGRESSIVE_CHARS = self.settings["progressive_render_chars"]
+        MessageRenderer.COLLAPSE_LINES = self.settings["collapse_block_lines"]
         self.config_panel.load_settings(self.settings)
         self.config_panel.update_ollama_path(self.ollama_path)
 
@@ -1560,27 +3770,52 @@ class App(ctk.CTk):
         self.chat_area.on_send_callback = self._send_message
         self.chat_area.on_stop_callback = self._stop_generation
         self.chat_area.on_regenerate_callback = self._regenerate
+        self.chat_area.on_continue_callback = self._continue
+        self.chat_area.on_delete_callback = self._delete_message
+        self.chat_area.input_box.bind("<Key>", lambda e: self._preload_model(), add="+")
+        self.chat_area.input_box.bind("<KeyRelease>", lambda e: self._schedule_token_gauge(), add="+")
+        self.config_panel.on_context_changed = self._schedule_token_gauge
         self.config_panel.on_theme_changed = self._theme_changed
         self.config_panel.on_refresh_models = self._refresh_models
         self.config_panel.on_browse_ollama = self._browse_ollama
-        self.config_panel.on_model_changed = self._fetch_model_details
+        self.config_panel.on_model_changed = self._model_changed
+        self.config_panel.on_think_changed = self._think_changed
 
     def _stop_generation(self):
         if self.is_streaming:
             self.abort_stream = True
 
     def _check_ollama(self):
-        try:
-            if requests.get(f"{OLLAMA_API_BASE}/api/tags", timeout=2).status_code == 200:
-                self._server_ready()
-                return
-        except:
-            pass
+        if self.client.is_up(timeout=2):
+            self._server_ready()
+            return
         if self.ollama_path and os.path.exists(self.ollama_path):
             self._start_server()
         else:
             self.after(100, self._prompt_ollama)
 
+    def _recover_checkpoint(self):
+        partial = StreamCheckpoint.recover()
+        if not partial:
+            return
+        sid = partial.get("session_id")
+        if partial["text"] and sid in self.session_manager.sessions:
+            if self.session_manager.has_message(sid, partial.get("message_id")):
+                # A continuation of an existing reply; the checkpoint holds the full text
+                self.session_manager.update_message(sid, partial["message_id"], partial["text"], True)
+            else:
+                self.session_manager.add_message(
+                    "assistant", partial["text"], session_id=sid,
+                    message_id=partial.get("message_id"), incomplete=True
+                )
+            self._select_session(sid)
+            messagebox.showinfo(
+                "Response Recovered",
+                "A response that was still streaming when the app closed has been recovered "
+                "and marked as interrupted. Use ⏩ on it to continue generating."
+            )
+        StreamCheckpoint.discard()
+
     def _prompt_ollama(self):
         if messagebox.askyesno("Ollama Not Found", f"Ollama not found at:\n{self.ollama_path}\n\nBrowse for it?"):
             self._browse_ollama()
@@ -1596,111 +3831,320 @@ class App(ctk.CTk):
             if messagebox.askyesno("Start Ollama?", "Start the server now?"):
                 self._start_server()
 
+    def _detach_stream(self):
+        """Stop drawing a running reply once its chat leaves the view; the
+        worker still stores it in the chat it belongs to."""
+        if self.is_streaming:
+            self.current_ai_widget = None
+
     def _new_chat(self):
+        self._detach_stream()
         self.session_manager.create_new_session()
         self.sidebar.refresh_sessions()
         self.chat_area.clear_messages()
+        self._sync_session_options()
 
     def _select_session(self, sid: str):
         if sid not in self.session_manager.sessions:
             self.sidebar.refresh_sessions()
             return
-        self.session_manager.current_session_id = sid
+        self._detach_stream()
+        self.session_manager.open_session(sid)
         self.sidebar.refresh_sessions()
         self.chat_area.reload_messages()
+        self._sync_session_options()
 
     def _delete_session(self, sid: str):
         self.session_manager.delete_session(sid)
         self.sidebar.refresh_sessions()
         if not self.session_manager.current_session_id:
+            self._detach_stream()
             self.chat_area.clear_messages()
+            self._sync_session_options()
+
+    def _sync_session_options(self):
+        """Show the open chat's own options, model and sampling settings in the
+        settings panel. A restored model is not preloaded here: browsing chats
+        should not evict the model that is loaded, so the swap waits until
+        the user starts typing."""
+        options = self.session_manager.get_session_options()
+        self.config_panel.set_think(options.get("think") is not False)
+        pinned = dict(options.get("sampling") or {})
+        model = self.session_manager.get_session_model()
+        if model:
+            pinned["model"] = model
+        previous = self.config_panel.model_var.get()
+        self.config_panel.load_settings(pinned)
+        if model and model != previous:
+            self._fetch_model_details(model)
+        self._show_residency()
+        self._update_token_gauge()
+
+    def _history_budget(self, settings: Dict) -> int:
+        """Prompt tokens that fit in the context window with room left for the reply."""
+        ctx = int(settings.get("context_length", 4096))
+        reserve = settings.get("num_predict") or 0
+        if reserve <= 0:
+            reserve = self.settings.get("reply_reserve", 1024)
+        return ctx - min(reserve, ctx // 2)
+
+    def _plan_history(self, settings: Dict, session_id: Optional[str] = None) -> Tuple[List[Dict], int, int]:
+        return self.session_manager.plan_history(settings.get("system_prompt", ""), self._history_budget(settings),
+                                                 self.settings.get("history_policy", "recent"), session_id)
+
+    def _schedule_token_gauge(self):
+        if self._gauge_job:
+            self.after_cancel(self._gauge_job)
+        self._gauge_job = self.after(300, self._update_token_gauge)
+
+    def _update_token_gauge(self):
+        """Tokens the next request would send, counting the unsent draft."""
+        self._gauge_job = None
+        settings = self.config_panel.get_settings()
+        _, used, dropped = self._plan_history(settings)
+        draft = self.chat_area.input_box.get("1.0", "end").strip()
+        if draft:
+            used += estimate_tokens(draft) + MESSAGE_TOKEN_OVERHEAD
+        self.chat_area.set_token_gauge(used, int(settings.get("context_length", 4096)), dropped)
+
+    def _pin_session(self):
+        settings = self.config_panel.get_settings()
+        self.session_manager.pin_session(settings["model"], {k: settings.get(k) for k in SESSION_SAMPLING_KEYS})
+
+    def _think_changed(self, enabled: bool):
+        # None leaves thinking to the model's default; False asks the server to skip it
+        had_session = self.session_manager.current_session_id in self.session_manager.sessions
+        self.session_manager.set_session_option("think", None if enabled else False)
+        if not had_session:
+            self.sidebar.refresh_sessions()
 
     def _send_message(self, text: str):
         settings = self.config_panel.get_settings()
         final = f"{settings.get('prefix', '')} {text} {settings.get('suffix', '')}".strip()
         self.session_manager.add_message("user", final)
-        self.chat_area.reload_messages()
+        self.chat_area.sync_messages()
         self._start_stream()
 
+    def _delete_message(self, index: int):
+        self.session_manager.delete_message(index)
+        self.chat_area.sync_messages()
+        self._update_token_gauge()
+
     def _regenerate(self):
+        if self.is_streaming:
+            return
         messages = self.session_manager.get_current_messages()
         if messages and messages[-1]["role"] == "assistant":
             self.session_manager.delete_message(len(messages) - 1)
-            self.chat_area.reload_messages()
+            self.chat_area.sync_messages()
             self._start_stream()
 
+    def _continue(self):
+        """Resume the last assistant reply from where it stopped, appending only
+        the newly generated tokens to the same message."""
+        if self.is_streaming:
+            return
+        messages = self.session_manager.get_current_messages()
+        if not messages or messages[-1]["role"] != "assistant":
+            return
+        self._pin_session()
+        self.is_streaming = True
+        self.abort_stream = False
+        self.chat_area.set_streaming_mode(True)
+        self.current_ai_widget = self.chat_area.last_message_widget()
+        self.current_ai_widget.set_streaming(True)
+        session_id = self.session_manager.current_session_id
+        updates = self._start_pump()
+        threading.Thread(target=self._stream_worker, args=(session_id, messages[-1]["id"], updates, messages[-1]),
+                         daemon=True).start()
+
     def _start_stream(self):
+        self._pin_session()
+        self._update_token_gauge()
         self.is_streaming = True
         self.abort_stream = False
         self.chat_area.set_streaming_mode(True)
         messages = self.session_manager.get_current_messages()
-        self.current_ai_widget = self.chat_area.add_message("assistant", "", len(messages), is_last=True)
+        message_id = str(uuid.uuid4())
+        self.current_ai_widget = self.chat_area.add_message("assistant", "", len(messages), is_last=True,
+                                                            key=message_id)
         self.current_ai_widget.set_streaming(True)
         self.chat_area.scroll_to_bottom()
-        threading.Thread(target=self._stream_worker, daemon=True).start()
-
-    def _stream_worker(self):
+        session_id = self.session_manager.current_session_id
+        updates = self._start_pump()
+        threading.Thread(target=self._stream_worker, args=(session_id, message_id, updates), daemon=True).start()
+
+    def _openai_chunks(self, model: str, history: List[Dict], settings: Dict):
+        stream = self.client.openai.chat.completions.create(
+            model=model,
+            messages=history,
+            stream=True,
+            temperature=settings.get("temperature", 0.7)
+        )
+        for chunk in stream:
+            choice = chunk.choices[0]
+            yield choice.delta.content or "", choice.finish_reason
+
+    def _native_chunks(self, model: str, history: List[Dict], settings: Dict, think: Optional[bool] = None):
+        """Ollama's native /api/chat, the default backend: it takes the context
+        length, sampling options and keep_alive from settings. A trailing
+        assistant message is treated as a prefill, so the model continues it
+        instead of starting a new turn. Reasoning sent as ``message.thinking``
+        is wrapped in think tags so it reaches the same filter as models that
+        inline it. The server's timings are recorded as "generation"."""
+        payload = {
+            "model": model, "messages": history, "stream": True,
+            "options": OllamaClient.chat_options(settings)
+        }
+        keep_alive = OllamaClient.keep_alive(settings)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        if think is not None:
+            payload["think"] = think
+        thinking = False
+        with self.client.post("/api/chat", json=payload, stream=True, timeout=(5, None)) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                done_reason = data.get("done_reason", "stop") if data.get("done") else None
+                if done_reason:
+                    self.client.record("generation", **OllamaClient.generation_stats(data))
+                message = data.get("message", {})
+                text = ""
+                if message.get("thinking"):
+                    text = message["thinking"] if thinking else "<think>" + message["thinking"]
+                    thinking = True
+                if thinking and (message.get("content") or done_reason):
+                    text += "</think>"
+                    thinking = False
+                yield text + message.get("content", ""), done_reason
+
+    def _stream_worker(self, session_id: str, message_id: str, updates: "queue.Queue",
+                       prefill: Optional[Dict] = None):
+        """Runs off the Tk thread: filters and parses the reply as it arrives and
+        queues (raw delta, visible delta, reasoning delta, render plan) for _pump_stream."""
+        checkpoint = StreamCheckpoint()
+        stream = StreamParser()
+        parts = [prefill["content"]] if prefill else []
+        incomplete = False
         try:
             settings = self.config_panel.get_settings()
-            client = OpenAI(base_url=OLLAMA_CHAT_URL, api_key=API_KEY)
-            history = self.session_manager.get_conversation_history(settings.get("system_prompt", ""))
-            
-            stream = client.chat.completions.create(
-                model=settings.get("model", "qwen3:1.7b"), 
-                messages=history,
-                stream=True, 
-                temperature=settings.get("temperature", 0.7)
-            )
+            model = settings.get("model", "qwen3:1.7b")
+            history = self._plan_history(settings, session_id)[0]
+            options = self.session_manager.get_session_options(session_id)
+            started = time.perf_counter()
+            first_token = None
+            self.client.timings.pop("generation", None)
+            if prefill or "think" in options or self.settings.get("api", "native") != "openai":
+                # Prefill and the think flag only exist on the native API
+                chunks = self._native_chunks(model, history, settings, options.get("think"))
+            else:
+                chunks = self._openai_chunks(model, history, settings)
             
-            full_response = ""
-            last_update = time.time()
-            last_scroll = time.time()
+            checkpoint.begin(session_id, message_id, model)
+            checkpoint.add("".join(parts))
+            if prefill:
+                # The widget already holds this text; it only needs the plan
+                updates.put(("delta", "", *stream.feed(prefill["content"])))
             
-            for chunk in stream:
+            for content, done_reason in chunks:
                 if self.abort_stream:
+                    incomplete = True
                     break
-                content = chunk.choices[0].delta.content or ""
+                if done_reason == "length":
+                    incomplete = True
                 if content:
-                    full_response += content
-                    now = time.time()
-                    if now - last_update >= 0.05:
-                        last_update = now
-                        self.after(0, lambda t=full_response: self._update_response(t))
-                        
-                        if now - last_scroll >= 0.15:
-                            last_scroll = now
-                            self.after(0, self.chat_area.request_scroll_to_bottom)
-            if full_response:
-                self.after(0, lambda t=full_response: self._update_response(t))
-                self.session_manager.add_message("assistant", full_response)
-
-            self.after(0, self._finish_stream)
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    parts.append(content)
+                    checkpoint.add(content)
+                    updates.put(("delta", content, *stream.feed(content)))
+            self.client.record("chat", first_token=first_token or 0.0, total=time.perf_counter() - started)
+            full_response = "".join(parts)
+            self._store_response(session_id, message_id, full_response, prefill, incomplete)
+            checkpoint.finish()
+            updates.put(("done", incomplete, *stream.finish()))
         except Exception as e:
+            # Keep whatever arrived before the failure so it can be continued
+            full_response = "".join(parts)
+            self._store_response(session_id, message_id, full_response, prefill, True)
+            checkpoint.finish()
             if not self.abort_stream:
-                self.after(0, lambda: self._update_response(f"Error: {str(e)}"))
-            self.after(0, self._finish_stream)
-
-    def _update_response(self, content: str):
-        if self.abort_stream:
-            return
-        if self.current_ai_widget:
-            self.current_ai_widget.update_content(content)
+                error = f"\n\nError: {str(e)}" if full_response else f"Error: {str(e)}"
+                updates.put(("delta", error, *stream.feed(error)))
+            updates.put(("done", bool(full_response), *stream.finish()))
+
+    def _store_response(self, session_id: str, message_id: str, content: str,
+                        prefill: Optional[Dict], incomplete: bool):
+        if prefill:
+            if content != prefill["content"] or incomplete != prefill.get("incomplete", False):
+                self.session_manager.update_message(session_id, message_id, content, incomplete)
+        elif content:
+            self.session_manager.add_message("assistant", content, session_id=session_id,
+                                             message_id=message_id, incomplete=incomplete)
+        self.session_manager.writer.flush()
+
+    def _start_pump(self) -> "queue.Queue":
+        """Fresh update queue for a new stream, drained once per frame on the Tk side."""
+        self._stream_updates = queue.Queue()
+        self._pump.start()
+        return self._stream_updates
+
+    def _pump_stream(self) -> bool:
+        """One frame of streaming UI work; False once the stream has finished."""
+        updates = self._stream_updates
+        raw, cleaned, reasoning = [], [], []
+        plan = None
+        finished = None
+        try:
+            while finished is None:
+                kind, value, visible, thought, plan = updates.get_nowait()
+                if kind == "delta":
+                    raw.append(value)
+                else:
+                    finished = value
+                cleaned.append(visible)
+                reasoning.append(thought)
+        except queue.Empty:
+            pass
+        if plan is not None and self.current_ai_widget:
+            # Everything since the last frame in one step; only the newest plan is drawn.
+            # Applied even after ⏹: the worker has stored these deltas, and the
+            # widget's raw text must stay equal to the saved message
+            self.current_ai_widget.apply_stream("".join(raw), "".join(cleaned), "".join(reasoning), plan)
+            if not self.abort_stream:
+                self.chat_area.request_scroll_to_bottom()
+            # Layout and the follow-scroll belong to this frame's timed cost
+            self.chat_area.flush_layout()
+        if finished is not None:
+            self._finish_stream(finished)
+            return False
+        return True
 
-    def _finish_stream(self):
+    def _finish_stream(self, incomplete: bool = False):
+        detached = self.current_ai_widget is None
         if self.current_ai_widget:
             self.current_ai_widget.set_streaming(False)
+            self.current_ai_widget.set_incomplete(incomplete)
             self.current_ai_widget.is_last = True
             self.current_ai_widget.index = len(self.session_manager.get_current_messages()) - 1
         self.is_streaming = False
         self.chat_area.set_streaming_mode(False)
+        if detached:
+            # The reply is stored by now; show it if its chat is open again
+            self.chat_area.sync_messages()
+        self.chat_area.show_generation_stats(self.client.timings.get("generation"))
+        self.residency.refresh()
+        self._update_token_gauge()
 
     def _toggle_server(self):
-        try:
-            if requests.get(f"{OLLAMA_API_BASE}/api/tags", timeout=1).status_code == 200:
-                self._stop_server()
-                return
-        except:
-            pass
+        if self.client.is_up():
+            self._stop_server()
+            return
         self._start_server()
 
     def _start_server(self):
@@ -1719,34 +4163,51 @@ class App(ctk.CTk):
 
     def _wait_server(self):
         for _ in range(30):
-            try:
-                if requests.get(f"{OLLAMA_API_BASE}/api/tags", timeout=1).status_code == 200:
-                    self.after(0, self._server_ready)
-                    return
-            except:
-                pass
+            if self.client.is_up():
+                self.after(0, self._server_ready)
+                return
             time.sleep(1)
         self.after(0, lambda: self.sidebar.update_server_status(False))
 
     def _server_ready(self):
         self.sidebar.update_server_status(True)
+        if self.settings.get("api") == "openai":
+            self.client.warm()
+        self.residency.start()
         self._refresh_models()
 
     def _refresh_models(self):
         try:
-            resp = requests.get(f"{OLLAMA_API_BASE}/api/tags", timeout=5)
+            resp = self.client.get("/api/tags", timeout=5)
             if resp.status_code == 200:
                 models = [m["name"] for m in resp.json().get("models", [])]
                 if models:
                     self.config_panel.update_models(models)
                     self._fetch_model_details(models[0])
+                    self._preload_model()
         except:
             pass
 
+    def _model_changed(self, model_name: str):
+        self._fetch_model_details(model_name)
+        self._show_residency()
+        self._preload_model()
+
+    def _preload_model(self):
+        """Bring the selected model into memory; a no-op while it is loaded or
+        loading, so typing after an idle unload starts the reload early."""
+        model = self.config_panel.model_var.get()
+        if self.is_streaming or model == "No models" or self.residency.status(model)[0] != "unloaded":
+            return
+        self.residency.preload(model, self.config_panel.get_settings())
+
+    def _show_residency(self):
+        self.config_panel.set_model_status(*self.residency.status(self.config_panel.model_var.get()))
+
     def _fetch_model_details(self, model_name: str):
         def run():
             try:
-                resp = requests.post(f"{OLLAMA_API_BASE}/api/show", json={"name": model_name}, timeout=5)
+                resp = self.client.post("/api/show", json={"name": model_name}, timeout=5)
                 if resp.status_code == 200:
                     data = resp.json()
                     # Default to 128k if detection fails (optimistic), so we don't restrict the user
@@ -1796,6 +4257,10 @@ class App(ctk.CTk):
 
     def _theme_changed(self, mode: str):
         self._save_settings()
+        self.session_manager.close()
+        self._pump.stop()
+        self.residency.stop()
+        self.client.close()
         self.destroy()
         new_app = App()
         new_app.mainloop()
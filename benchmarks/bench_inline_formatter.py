@@ -0,0 +1,102 @@
+"""Micro-benchmark for InlineFormatter._parse_segments.
+
+Compares the single-pass tokenizer against the previous collect/sort/overlap
+implementation (kept here as a reference) and checks both produce identical
+segments before timing them.
+
+    python benchmarks/bench_inline_formatter.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OllamaChatInterface import InlineFormatter  # noqa: E402
+
+
+def legacy_parse_segments(text):
+    segments = []
+    current_pos = 0
+    events = []
+    for pattern, tag in InlineFormatter.PATTERNS:
+        for match in pattern.finditer(text):
+            events.append((match.start(), match.end(), match.group(1), tag, match.group(0)))
+    events.sort(key=lambda x: (x[0], -x[1]))
+    used_ranges = []
+    filtered_events = []
+    for start, end, content, tag, full_match in events:
+        overlaps = False
+        for used_start, used_end in used_ranges:
+            if start < used_end and end > used_start:
+                overlaps = True
+                break
+        if not overlaps:
+            filtered_events.append((start, end, content, tag, full_match))
+            used_ranges.append((start, end))
+    filtered_events.sort(key=lambda x: x[0])
+    for start, end, content, tag, full_match in filtered_events:
+        if start > current_pos:
+            segments.append((text[current_pos:start], ()))
+        if tag == 'bold':
+            for nested_text, nested_tags in InlineFormatter._parse_nested_in_bold(content):
+                segments.append((nested_text, ('bold',) + nested_tags if nested_tags else ('bold',)))
+        else:
+            segments.append((content, (tag,)))
+        current_pos = end
+    if current_pos < len(text):
+        segments.append((text[current_pos:], ()))
+    return segments
+
+
+def make_corpus(rng, count):
+    pieces = [
+        "plain words here", "`code()`", "`x = 1`", "**bold**", "*italic*", "_under_",
+        "__strong__", "***both***", "~~gone~~", "<u>u</u>", "**_mixed_**", "**a *b* c**",
+        "snake_case_name", "2 * 3 * 4", "a `b` c `d` e", "**", "*", "_", "`",
+    ]
+    lines = []
+    for _ in range(count):
+        lines.append(" ".join(rng.choice(pieces) for _ in range(rng.randint(4, 40))))
+    return lines
+
+
+def fuzz_corpus(rng, count):
+    alphabet = "ab *_~`<u>/ "
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(count)]
+
+
+def lines_per_second(fn, lines, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            fn(line)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def main():
+    rng = random.Random(1234)
+    corpus = make_corpus(rng, 3000)
+    for line in corpus + fuzz_corpus(rng, 20000):
+        expected = legacy_parse_segments(line)
+        actual = InlineFormatter._parse_segments(line)
+        if expected != actual:
+            raise SystemExit(f"Mismatch on {line!r}:\n  legacy: {expected}\n  new:    {actual}")
+    print(f"Output identical on {len(corpus) + 20000} lines")
+
+    prose = [" ".join(["Plain prose with no inline markup at all."] * rng.randint(1, 6)) for _ in range(3000)]
+    long_lines = [" ".join(corpus[i:i + 8]) for i in range(0, len(corpus), 8)]
+    very_long_lines = [" ".join(corpus[i:i + 64]) for i in range(0, len(corpus), 64)]
+    for label, lines in (("plain prose", prose), ("typical lines", corpus),
+                         ("long lines", long_lines), ("very long lines", very_long_lines)):
+        before = lines_per_second(legacy_parse_segments, lines)
+        after = lines_per_second(InlineFormatter._parse_segments, lines)
+        print(f"{label:>15}: legacy {before:10.0f} lines/s   single-pass {after:10.0f} lines/s   "
+              f"x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Token-budget trimming of the history sent with each request.
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import OllamaChatInterface as oci  # noqa: E402
+from OllamaChatInterface import (  # noqa: E402
+    App, JournalSessionStore, MESSAGE_TOKEN_OVERHEAD, SessionManager, estimate_tokens
+)
+
+SYSTEM = "You are a helpful AI assistant."
+TEXT = "word " * 40
+
+
+class PlanHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        store = JournalSessionStore(os.path.join(self.dir, "sessions.json"), os.path.join(self.dir, "sessions.journal"))
+        self.manager = SessionManager(store=store)
+        self.manager.create_new_session()
+        for i in range(6):
+            self.manager.add_message("user" if i % 2 == 0 else "assistant", f"{i} {TEXT}")
+        self.system_cost = estimate_tokens(SYSTEM) + MESSAGE_TOKEN_OVERHEAD
+        self.cost = estimate_tokens(f"0 {TEXT}") + MESSAGE_TOKEN_OVERHEAD
+
+    def tearDown(self):
+        self.manager.close()
+        shutil.rmtree(self.dir)
+
+    def plan(self, messages_that_fit, policy="recent"):
+        history, used, dropped = self.manager.plan_history(
+            SYSTEM, self.system_cost + messages_that_fit * self.cost, policy)
+        self.assertEqual(history[0], {"role": "system", "content": SYSTEM})
+        return [int(m["content"].split()[0]) for m in history[1:]], used, dropped
+
+    def test_without_budget_everything_is_sent(self):
+        history, used, dropped = self.manager.plan_history(SYSTEM)
+        self.assertEqual(len(history), 7)
+        self.assertEqual((used, dropped), (self.system_cost + 6 * self.cost, 0))
+
+    def test_all_ignores_the_budget(self):
+        self.assertEqual(self.plan(1, "all")[0], [0, 1, 2, 3, 4, 5])
+
+    def test_recent_keeps_newest_turns(self):
+        self.assertEqual(self.plan(4), ([2, 3, 4, 5], self.system_cost + 4 * self.cost, 2))
+
+    def test_recent_never_opens_with_an_orphaned_reply(self):
+        self.assertEqual(self.plan(3), ([4, 5], self.system_cost + 2 * self.cost, 4))
+
+    def test_first_and_recent_keeps_the_opening_message(self):
+        self.assertEqual(self.plan(3, "first_and_recent"), ([0, 4, 5], self.system_cost + 3 * self.cost, 3))
+
+    def test_newest_message_goes_even_over_budget(self):
+        self.assertEqual(self.plan(0)[0::2], ([5], 5))
+
+    def test_unknown_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.manager.plan_history(SYSTEM, 100, "oldest")
+
+
+class ReplyReserveTest(unittest.TestCase):
+    def budget(self, reply_reserve=1024, **settings):
+        app = types.SimpleNamespace(settings={"reply_reserve": reply_reserve})
+        return App._history_budget(app, settings)
+
+    def test_reserve(self):
+        self.assertEqual(self.budget(context_length=4096), 3072)
+        self.assertEqual(self.budget(context_length=4096, num_predict=300), 3796)
+        self.assertEqual(self.budget(context_length=4096, num_predict=-1), 3072)
+        self.assertEqual(self.budget(reply_reserve=256, context_length=4096), 3840)
+
+    def test_reserve_is_capped_at_half_the_context(self):
+        self.assertEqual(self.budget(context_length=1024), 512)
+
+
+class HistoryPolicySettingTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.settings_file = oci.SETTINGS_FILE
+        oci.SETTINGS_FILE = os.path.join(self.dir, "settings.json")
+
+    def tearDown(self):
+        oci.SETTINGS_FILE = self.settings_file
+        shutil.rmtree(self.dir)
+
+    def load(self, policy):
+        with open(oci.SETTINGS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"history_policy": policy}, f)
+        return App._load_settings(None)["history_policy"]
+
+    def test_known_policy_is_kept(self):
+        self.assertEqual(self.load("first_and_recent"), "first_and_recent")
+
+    def test_unknown_policy_falls_back_to_recent(self):
+        self.assertEqual(self.load("oldest"), "recent")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""Streamed parsing must end where a one-shot parse of the same text does.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OllamaChatInterface import (  # noqa: E402
+    MarkdownBlockParser, RenderPlan, StreamParser, ThinkTagFilter, parse_markdown
+)
+
+DOCUMENT = """# Title
+
+Some **bold** and `code` text.
+- item one
+- item *two*
+
+```python
+def f():
+    return "| not a table |"
+```
+| a | b |
+|---|---|
+| 1 | 2 |
+after the table
+```
+unterminated"""
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def split_at(text, *needles):
+    """Cut the text in the middle of each needle, so the fence or row is split."""
+    cuts = sorted(text.index(n) + len(n) // 2 for n in needles)
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+class StreamedParseTest(unittest.TestCase):
+    def assertSamePlan(self, plan, expected):
+        self.assertEqual(plan.blocks, expected.blocks)
+        self.assertEqual((plan.tail, plan.finished, plan.has_formatting), (expected.tail, True, expected.has_formatting))
+        self.assertEqual((plan.text, plan.reasoning), (expected.text, expected.reasoning))
+
+    def stream(self, chunks):
+        parser = StreamParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.finish()[2]
+
+    def test_any_chunk_size_gives_the_one_shot_plan(self):
+        expected = parse_markdown(DOCUMENT)
+        for size in range(1, 12):
+            with self.subTest(size=size):
+                self.assertSamePlan(self.stream(chunked(DOCUMENT, size)), expected)
+
+    def test_fences_and_table_rows_split_across_chunks(self):
+        expected = parse_markdown(DOCUMENT)
+        self.assertEqual([b.kind for b in expected.blocks], ["text", "code", "table", "text", "code"])
+        chunks = split_at(DOCUMENT, "```python", "\n```\n", "| a | b |", "|---|---|", "| 1 | 2 |")
+        self.assertSamePlan(self.stream(chunks), expected)
+
+    def test_think_tags_are_filtered_the_same_way(self):
+        text = "<think>weighing it up</think>\n" + DOCUMENT
+        expected = parse_markdown(text)
+        self.assertEqual(expected.reasoning, "weighing it up")
+        self.assertSamePlan(self.stream(chunked(text, 3)), expected)
+
+    def test_block_parser_alone(self):
+        oneshot = MarkdownBlockParser()
+        oneshot.feed(DOCUMENT)
+        oneshot.finish()
+        for size in (1, 2, 5):
+            with self.subTest(size=size):
+                parser = MarkdownBlockParser()
+                for chunk in chunked(DOCUMENT, size):
+                    parser.feed(chunk)
+                parser.finish()
+                self.assertEqual(RenderPlan(parser).blocks, RenderPlan(oneshot).blocks)
+
+    def test_streaming_plans_only_grow(self):
+        parser = StreamParser()
+        seen = ()
+        for chunk in chunked(DOCUMENT, 4):
+            blocks = parser.feed(chunk)[2].blocks
+            for before, after in zip(seen, blocks):
+                if before.closed:
+                    self.assertEqual(before, after)
+                else:
+                    self.assertEqual(after.lines[:len(before.lines)], before.lines)
+            seen = blocks
+
+
+class ThinkTagFilterTest(unittest.TestCase):
+    CASES = [
+        ("<think>plan it</think>\n\nHello <b>world</b>  ", "Hello <b>world</b>", "plan it"),
+        ("a<think>x</think>b<think>y</think>c", "abc", "x\n\ny"),
+        ("keep <thinking> and </thin", "keep <thinking> and </thin", ""),
+        ("stray </think> tag", "stray  tag", ""),
+        ("answer <think>unfinished", "answer", "unfinished"),
+        ("  \n<think>r</think>  hi  \n", "hi", "r"),
+    ]
+
+    def run_filter(self, chunks):
+        think_filter = ThinkTagFilter()
+        visible, reasoning = [], []
+        for chunk in chunks:
+            visible.append(think_filter.feed(chunk))
+            reasoning.append(think_filter.take_reasoning())
+        visible.append(think_filter.finish())
+        reasoning.append(think_filter.take_reasoning())
+        return "".join(visible), "".join(reasoning)
+
+    def test_every_two_way_split(self):
+        for text, visible, reasoning in self.CASES:
+            for cut in range(len(text) + 1):
+                with self.subTest(text=text, cut=cut):
+                    self.assertEqual(self.run_filter([text[:cut], text[cut:]]), (visible, reasoning))
+
+    def test_one_character_at_a_time(self):
+        for text, visible, reasoning in self.CASES:
+            with self.subTest(text=text):
+                self.assertEqual(self.run_filter(list(text)), (visible, reasoning))
+
+    def test_partial_tag_is_held_back(self):
+        think_filter = ThinkTagFilter()
+        self.assertEqual(think_filter.feed("answer <th"), "answer")
+        self.assertEqual(think_filter.feed("ink>sec"), "")
+        self.assertEqual(think_filter.take_reasoning(), "sec")
+        self.assertEqual(think_filter.feed("ret</thi"), "")
+        self.assertEqual(think_filter.take_reasoning(), "ret")
+        self.assertEqual(think_filter.feed("nk> done"), "  done")
+        self.assertEqual(think_filter.finish(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Crash-recovery checks for the session journal.
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OllamaChatInterface import JournalSessionStore, PersistenceWriter  # noqa: E402
+
+
+def create(sid):
+    return {"op": "create_session", "session_id": sid,
+            "session": {"title": "New Chat", "created_at": "t", "updated_at": "t", "messages": [], "model": None}}
+
+
+def add(sid, mid, content):
+    return {"op": "add_message", "session_id": sid,
+            "message": {"id": mid, "role": "user", "content": content, "timestamp": "t"}}
+
+
+class JournalRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.dir, "sessions.json")
+        self.journal = os.path.join(self.dir, "sessions.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def open_store(self):
+        store = JournalSessionStore(self.snapshot, self.journal)
+        store.load()
+        return store
+
+    def contents(self, store, sid="s"):
+        return [m["content"] for m in store.load_messages(sid)]
+
+    def test_round_trip(self):
+        self.open_store().append_many([create("s"), add("s", "1", "first"), add("s", "2", "second")])
+        self.assertEqual(self.contents(self.open_store()), ["first", "second"])
+
+    def test_appends_after_torn_tail_survive(self):
+        self.open_store().append_many([create("s"), add("s", "1", "first")])
+        with open(self.journal, "a", encoding="utf-8") as f:
+            f.write(json.dumps(add("s", "2", "lost"))[:25])  # Crash mid-append
+        store = self.open_store()
+        self.assertEqual(self.contents(store), ["first"])
+        store.append_many([add("s", "3", "after restart")])
+        self.assertEqual(self.contents(self.open_store()), ["first", "after restart"])
+
+    def test_unterminated_last_record_is_kept(self):
+        self.open_store().append_many([create("s")])
+        with open(self.journal, "a", encoding="utf-8") as f:
+            f.write(json.dumps(add("s", "1", "no newline")))
+        self.open_store().append_many([add("s", "2", "next")])
+        self.assertEqual(self.contents(self.open_store()), ["no newline", "next"])
+
+
+class PersistenceWriterTest(unittest.TestCase):
+    def test_idle_flush_keeps_debounce(self):
+        batches = []
+        writer = PersistenceWriter(lambda batch: batches.append(len(batch)))
+        writer.FLUSH_DELAY = 0.2
+        writer.flush()  # Nothing queued
+        writer.submit({})
+        time.sleep(0.05)
+        writer.submit({})
+        writer.flush()
+        writer.close()
+        self.assertEqual(batches, [2])
+
+
+if __name__ == "__main__":
+    unittest.main()